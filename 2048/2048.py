@@ -1,83 +1,202 @@
 from random import choice, randrange
 
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.core.text import Label as CoreLabel
 from kivy.core.window import Window
 from kivy.factory import Factory
-from kivy.graphics import Color, Rectangle
-from kivy.uix.label import Label
+from kivy.graphics import Color, InstructionGroup, Rectangle
+from kivy.metrics import sp
+from kivy.properties import ListProperty, NumericProperty
 from kivy.uix.screenmanager import ScreenManager, Screen
+from kivy.uix.widget import Widget
 from kivy.utils import get_color_from_hex
 
 
-DOWN_RIGHT_ORDER = [-1, -2, -3, -4]
+DOWN_RIGHT_ORDER = [3, 2, 1, 0]
 UP_LEFT_ORDER = [0, 1, 2, 3]
 
-
-class Cell(Label):
-    """
-    This class represents the blocks of the game.
-
-    Basically, each block contains a value (2, 4, 8, 16...), a cell 
-    coordinate ((0,0), (2,3)) and some properties that decides font size,
-    color and text to represent.
+# cell colors depending on his value
+COLORS = {
+    2: get_color_from_hex('#00ff00'),
+    4: get_color_from_hex('#ccff00'),
+    8: get_color_from_hex('#ffff00'),
+    16: get_color_from_hex('#ffffaa'),
+    32: get_color_from_hex('#ff0000'),
+    64: get_color_from_hex('#0000ff'),
+    128: get_color_from_hex('#ff00ff'),
+    256: get_color_from_hex('#00ffff'),
+    512: get_color_from_hex('#ffff00'),
+    1024: get_color_from_hex('#ff0000'),
+    2048: get_color_from_hex('#0000ff'),
+}
+EMPTY = get_color_from_hex('#ed4c2e')
+
+
+class Board(Widget):
     """
-    def __init__(self, **kwargs):
-        self.row = kwargs.pop('row')
-        self.col = kwargs.pop('col')
-        self._value = None              # 2, 4, 8, 16, 32, 64, 128, 256, 512...
-
-        super(Cell, self).__init__(**kwargs)
-
-        self.font_size = 50
-
-        # add instructions rendered before
-        with self.canvas.before:
-            # set the background color, size and position
-            self.bg_color = Color(.5, .5, 1)
-            self.rectangle = Rectangle(size=self.size, pos=self.pos)
-
-        # important!:   update rectangle position and size
-        self.bind(pos=self.update_rect, size=self.update_rect)
-
-        # cell colors depending on his value
-        self.colors = {
-            2: get_color_from_hex('#00ff00'),
-            4: get_color_from_hex('#ccff00'),
-            8: get_color_from_hex('#ffff00'),
-            16: get_color_from_hex('#ffffaa'),
-            32: get_color_from_hex('#ff0000'),
-            64: get_color_from_hex('#0000ff'),
-            128: get_color_from_hex('#ff00ff'),
-            256: get_color_from_hex('#00ffff'),
-            512: get_color_from_hex('#ffff00'),
-            1024: get_color_from_hex('#ff0000'),
-            2048: get_color_from_hex('#0000ff'),
-        }
-
-    # manual binding settup is required in Kivy
-    def update_rect(self, instance, value):
-        self.rectangle.pos = self.pos
-        self.rectangle.size = self.size
+    Grid of cells drawn as one group of canvas instructions, a Color and a
+    Rectangle per cell, instead of one Label widget per cell.
 
-    @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self, value):
-        self._value = value
+    set only records the new value, the colors of the cells changed are
+    updated together once per frame. The text of a cell is a Rectangle with
+    the texture of the text (cached), only created for the cells that show
+    some. rows, cols, spacing and padding (left, top, right, bottom) work like
+    in GridLayout.
 
-        if value is None:
-            self.text = ''
-            self.bg_color.rgb = get_color_from_hex('#ed4c2e')
-            return
+    The empty cells are kept in a list, a cell filled is swapped with the
+    last one and removed, so random_free picks one in constant time.
+    """
+    rows = NumericProperty(1)
+    cols = NumericProperty(1)
+    spacing = NumericProperty(0)
+    padding = ListProperty([0, 0, 0, 0])
+    font_size = NumericProperty(sp(15))
+    text_color = ListProperty([1, 1, 1, 1])
 
-        self.text = str(value)
-        self.bg_color.rgb = self.colors[value]
+    # Textures of the texts drawn, shared by all the boards
+    textures = {}
 
-    def __repr__(self):
-        return '<Cell object in position ({}, {}) value={}>'.format(
-            self.row, self.col, self.value)
+    def build(self, colors, empty):
+        """
+        create the cells, all empty, each cell shows its value as its text
+            colors -- color (rgba) of each value
+            empty  -- color of the empty cells (value None)
+        """
+        self.colors = colors
+        self.empty = empty
+        self.values = [[None] * self.cols for __ in range(self.rows)]
+        self.dirty = {}
+
+        # Empty cells, and the index of each one in free
+        self.free = [(row, col) for row in range(self.rows)
+                     for col in range(self.cols)]
+        self.free_index = {cell: i for i, cell in enumerate(self.free)}
+        self.flush_trigger = Clock.create_trigger(self.flush)
+
+        self.cell_colors = []
+        self.rectangles = []
+        group = InstructionGroup()
+        for row in range(self.rows):
+            self.cell_colors.append([])
+            self.rectangles.append([])
+            for col in range(self.cols):
+                color = Color(*empty)
+                rectangle = Rectangle()
+                group.add(color)
+                group.add(rectangle)
+                self.cell_colors[row].append(color)
+                self.rectangles[row].append(rectangle)
+        self.canvas.add(group)
+
+        # Texts over the cells, (row, col) -> Rectangle
+        self.texts = {}
+        self.text_group = InstructionGroup()
+        self.canvas.add(self.text_group)
+        self.clear_text()
+
+        self.bind(pos=self.layout, size=self.layout)
+        self.layout()
+
+    def cell_size(self):
+        left, top, right, bottom = self.padding
+        return ((self.width - left - right - self.spacing*(self.cols-1)) /
+                self.cols,
+                (self.height - top - bottom - self.spacing*(self.rows-1)) /
+                self.rows)
+
+    def cell_pos(self, row, col):
+        """bottom left corner of the cell, row 0 is the top one"""
+        width, height = self.cell_size()
+        return (self.x + self.padding[0] + col*(width + self.spacing),
+                self.top - self.padding[1] - (row+1)*height -
+                row*self.spacing)
+
+    def layout(self, *args):
+        """place all the cells, after a change of size or position"""
+        size = self.cell_size()
+        for row in range(self.rows):
+            for col in range(self.cols):
+                rectangle = self.rectangles[row][col]
+                rectangle.pos = self.cell_pos(row, col)
+                rectangle.size = size
+        for row, col in self.texts:
+            self.place_text(row, col)
+
+    def get(self, row, col):
+        return self.values[row][col]
+
+    def set(self, row, col, value):
+        """change the value of a cell, drawn in the next frame"""
+        if self.values[row][col] != value:
+            if value is None:
+                self.add_free((row, col))
+            elif self.values[row][col] is None:
+                self.remove_free((row, col))
+            self.values[row][col] = value
+            self.dirty[(row, col)] = value
+            self.flush_trigger()
+
+    def add_free(self, cell):
+        self.free_index[cell] = len(self.free)
+        self.free.append(cell)
+
+    def remove_free(self, cell):
+        index = self.free_index.pop(cell)
+        last = self.free.pop()
+        if last != cell:
+            self.free[index] = last
+            self.free_index[last] = index
+
+    def random_free(self):
+        """ A random empty cell (row, col), None if there is none """
+        if not self.free:
+            return None
+        return self.free[randrange(len(self.free))]
+
+    def flush(self, *args):
+        """draw the cells changed since the last frame"""
+        for (row, col), value in self.dirty.items():
+            if value is None:
+                self.cell_colors[row][col].rgba = self.empty
+            else:
+                self.cell_colors[row][col].rgba = self.colors[value]
+            self.set_text(row, col, '' if value is None else str(value))
+        self.dirty = {}
+
+    def texture(self, text):
+        key = (text, self.font_size)
+        if key not in self.textures:
+            label = CoreLabel(text=text, font_size=self.font_size)
+            label.refresh()
+            self.textures[key] = label.texture
+        return self.textures[key]
+
+    def place_text(self, row, col):
+        """center the text rectangle of a cell in it"""
+        rectangle = self.texts[(row, col)]
+        x, y = self.cell_pos(row, col)
+        width, height = self.cell_size()
+        rectangle.pos = (x + (width - rectangle.size[0]) / 2,
+                         y + (height - rectangle.size[1]) / 2)
+
+    def set_text(self, row, col, text):
+        """write text over a cell ('' to remove it)"""
+        rectangle = self.texts.pop((row, col), None)
+        if rectangle is not None:
+            self.text_group.remove(rectangle)
+        if text:
+            texture = self.texture(text)
+            rectangle = Rectangle(texture=texture, size=texture.size)
+            self.text_group.add(rectangle)
+            self.texts[(row, col)] = rectangle
+            self.place_text(row, col)
+
+    def clear_text(self):
+        """remove all the texts"""
+        self.texts = {}
+        self.text_group.clear()
+        self.text_group.add(Color(*self.text_color))
 
 
 class GameScreen(Screen):
@@ -91,18 +210,10 @@ class GameScreen(Screen):
         super(GameScreen, self).__init__(**kwargs)
 
         self._score = 0
-        self.grid = list()
-
-        # generating the empty 4x4 grid
-        for row in range(4):
-            self.grid.append([])
-
-            for col in range(4):
-                cell = Cell(row=row, col=col)               # default cell
 
-                # adding cell to the 4x4 grid
-                self.ids.grid_layout.add_widget(cell)
-                self.grid[row].append(cell)
+        # the empty 4x4 grid, each cell shows its value
+        self.board = self.ids.board
+        self.board.build(COLORS, EMPTY)
 
         self.new_game()
 
@@ -115,43 +226,43 @@ class GameScreen(Screen):
             self.spawn_randon_number()
 
     def reset(self):
-        for row in self.grid:
-            for cell in row:
-                cell.value = None
+        for row in range(4):
+            for col in range(4):
+                self.board.set(row, col, None)
+        self.board.flush()
+        self.board.clear_text()
 
     def spawn_randon_number(self):
-        has_value = True
-
-        while has_value:
-            coord_x = randrange(4)
-            coord_y = randrange(4)
-            has_value = self.grid[coord_x][coord_y].value
+        """ A 2 or a 4 in a random empty cell, False if there is none """
+        cell = self.board.random_free()
+        if cell is None:
+            return False
 
-            if has_value is None:
-                self.grid[coord_x][coord_y].value = choice([2, 4])
+        self.board.set(*cell, choice([2, 4]))
+        return True
 
     def win(self):
         self.reset()
 
         for i, letter in enumerate([('Y', 'W'),('O', 'I'),('U', 'N')]):
-            self.grid[1][i].text = letter[0]
-            self.grid[2][i+1].text = letter[1]
+            self.board.set_text(1, i, letter[0])
+            self.board.set_text(2, i+1, letter[1])
 
     def get_row(self, x, order):
-        """ Return a list of cells of a given row coordinate. """
+        """ Return a list of cell positions of a given row coordinate. """
         row = []
 
         for index in order:
-            row.append(self.grid[x][index])
+            row.append((x, index))
 
         return row
         
     def get_col(self, y, order):
-        """ Return a list of cells of a given column coordinate. """
+        """ Return a list of cell positions of a given column coordinate. """
         col = []
         
         for index in order:
-            col.append(self.grid[index][y])
+            col.append((index, y))
 
         return col
 
@@ -160,9 +271,9 @@ class GameScreen(Screen):
         actual_x = x
         while actual_x>0 and join==1:
             actual_x -= 1
-            if col_row[actual_x].value == value:
+            if self.board.get(*col_row[actual_x]) == value:
                 join = 2
-            elif col_row[actual_x].value is not None:
+            elif self.board.get(*col_row[actual_x]) is not None:
                 actual_x += 1
                 break
 
@@ -179,13 +290,14 @@ class GameScreen(Screen):
             col = self.get_col(y, order)
             # for each element of the column
             for x, cell in enumerate(col):
-                value = cell.value
+                value = self.board.get(*cell)
                 # check if the current cell has a value
                 if value is not None:
                     new_x, join = self.make_move(x, y, col, value)
                     if new_x != x:
                         x = order[new_x]
-                        self.grid[x][y].value, cell.value = value * join, None
+                        self.board.set(x, y, value * join)
+                        self.board.set(*cell, None)
                         win = self.update_score_and_win_check(value, join)
                         has_moved = True
 
@@ -203,12 +315,13 @@ class GameScreen(Screen):
             # for each element of the row
             for y, cell in enumerate(row):
                 # check if the current cell has a value
-                value = cell.value
+                value = self.board.get(*cell)
                 if value is not None:
                     new_y, join = self.make_move(y, x, row, value)
                     if new_y != y:
                         y = order[new_y]
-                        self.grid[x][y].value, cell.value = value * join, None
+                        self.board.set(x, y, value * join)
+                        self.board.set(*cell, None)
                         win = self.update_score_and_win_check(value, join)
                         has_moved = True
 
@@ -0,0 +1,161 @@
+"""
+Anytime solving (python3 videos.py --deadline SECONDS [--resume]).
+
+A solution is built with the chosen solver and improved with optimize.py
+until the deadline (seconds since the start). There is always a valid
+solution: the best one is written to <input>.out at every checkpoint, on
+Ctrl-C and at the deadline, together with <input>.state.json:
+
+    input, sha1     -- input file and hash of its content
+    score, seconds  -- score of the solution and optimization time so far
+    capacity_left   -- MB left in each cache server
+    solution        -- [[server, [videos]], ...] as get_result
+
+--resume starts from the state file (if it is for the same input) instead
+of solving again, so long runs can be split in several.
+
+The construction is stopped at the deadline too (with a timer signal, on
+systems with signal.setitimer), keeping the videos placed so far: every
+solver adds them to dc.solution one by one, checking the capacity first.
+"""
+import json
+import os
+import signal
+import tempfile
+import threading
+import time
+
+from optimize import optimize
+from score import score
+from videos import file_sha1, read_in_file, write_result
+
+# The files written get the permissions open() would give them (mkstemp
+# makes them private)
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+
+
+def replace_file(filename, write):
+    """
+    write(fn) to a temporary file of its own moved to filename, so it is
+    never left half written, not even by two runs saving at once
+    """
+    fd, tmp = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)), suffix='.tmp',
+        prefix=os.path.basename(filename) + '.')
+    try:
+        with os.fdopen(fd, 'w') as fn:
+            write(fn)
+        os.chmod(tmp, 0o666 & ~UMASK)
+        os.replace(tmp, filename)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+class Deadline(Exception):
+    """the time to build the solution is over"""
+
+
+def run_until(solver, dc, seconds):
+    """
+    solver(dc), raising Deadline if it takes more than seconds (only in the
+    main thread of systems with signal.setitimer, elsewhere it is not
+    stopped)
+    """
+    if (not hasattr(signal, 'setitimer') or
+            threading.current_thread() is not threading.main_thread()):
+        return solver(dc)
+    if seconds <= 0:
+        raise Deadline
+
+    def alarm(*args):
+        raise Deadline
+
+    previous = signal.signal(signal.SIGALRM, alarm)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        return solver(dc)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def save_state(in_file, sha1, scorer, seconds):
+    """write the solution of scorer to the .out and .state.json files"""
+    solution = scorer.solution()
+    state = {
+        'input': in_file,
+        'sha1': sha1,
+        'score': scorer.score,
+        'seconds': round(seconds, 1),
+        'capacity_left': {s: scorer.servers[s].capacity - used
+                          for s, used in scorer.used.items()},
+        'solution': solution,
+    }
+    replace_file(in_file + '.out', lambda fn: write_result(fn, solution))
+    replace_file(in_file + '.state.json', lambda fn: json.dump(state, fn))
+
+
+def load_state(in_file, sha1):
+    """state saved for in_file or None if there is none or it is outdated"""
+    try:
+        with open(in_file + '.state.json') as fn:
+            state = json.load(fn)
+    except FileNotFoundError:
+        return None
+
+    if state['sha1'] != sha1:
+        print('{}: the input has changed, not resuming'.format(in_file))
+        return None
+    return state
+
+
+def solve_anytime(in_file, solver, deadline, resume=False, every=10.0,
+                  load=read_in_file, reduce=False):
+    """
+    solve in_file until deadline (seconds from now) keeping the .out file
+    updated with the best solution
+        load    -- function(in_file) returning the DataCenter
+        reduce  -- reduce the problem with preprocess.py before solving
+        return  -- best solution
+    """
+    start = time.perf_counter()
+    sha1 = file_sha1(in_file)
+    state = load_state(in_file, sha1) if resume else None
+    seconds = 0
+
+    if state is not None:
+        result, seconds = state['solution'], state['seconds']
+        print('{}: resuming from score {}'.format(in_file, state['score']))
+    else:
+        dc = load(in_file)
+        print(dc)
+        if reduce:
+            from preprocess import print_report, reduce_problem
+            print_report(reduce_problem(dc))
+        try:
+            result = run_until(solver, dc,
+                               deadline - (time.perf_counter() - start))
+        except (KeyboardInterrupt, Deadline):
+            # The solution so far is valid, just not complete
+            result = [[k, v] for k, v in dc.solution.items()]
+            deadline = 0
+
+    # Scoring and optimizing do not change the DataCenter, one just read
+    # is shared by both
+    fresh = load(in_file)
+
+    def checkpoint(solution, __=None):
+        save_state(in_file, sha1, score(fresh, solution),
+                   seconds + time.perf_counter() - start)
+
+    checkpoint(result)
+
+    budget = deadline - (time.perf_counter() - start)
+    if budget > 0:
+        result, __ = optimize(fresh, result, budget, verbose=False,
+                              checkpoint=checkpoint, every=every)
+        checkpoint(result)
+
+    return result
@@ -0,0 +1,236 @@
+"""
+Compact version of the DataCenter for big inputs.
+
+All the data is kept in NumPy arrays, the end point - cache server latencies
+and the requests are stored in CSR layout (one row per server, end point or
+video). Thin views (CSRRow, VideoView) give the same interface as the dicts
+and objects of videos.py so get_result and get_result_lazy work on it.
+"""
+from collections.abc import MutableMapping, Sequence
+
+import numpy as np
+
+from fastio import tokenize
+from videos import DataCenter, Endpoint, Server, Video
+
+
+def csr(rows, n_rows):
+    """
+    return (indptr, order) so that order[indptr[r]:indptr[r+1]] are the
+    positions of the entries of row r (stable, keeps the input order)
+    """
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, order
+
+
+class CSRRow(MutableMapping):
+    """
+    dict-like view of one row of a CSR matrix: cols are the keys (in
+    insertion order, like a dict) and data[pos] the values. Writing a value
+    writes in the shared data array, with skip_zeros the entries with value 0
+    are hidden (deleted)
+    """
+    __slots__ = ('cols', 'pos', 'data', 'skip_zeros')
+
+    def __init__(self, cols, pos, data, skip_zeros=False):
+        self.cols = cols
+        self.pos = pos
+        self.data = data
+        self.skip_zeros = skip_zeros
+
+    def _index(self, key):
+        """position of key in data or -1"""
+        i = np.flatnonzero(self.cols == key)
+        if not len(i):
+            return -1
+        p = self.pos[i[0]]
+        if self.skip_zeros and not self.data[p]:
+            return -1
+        return p
+
+    def get(self, key, default=None):
+        p = self._index(key)
+        return default if p < 0 else int(self.data[p])
+
+    def __getitem__(self, key):
+        p = self._index(key)
+        if p < 0:
+            raise KeyError(key)
+        return int(self.data[p])
+
+    def __setitem__(self, key, value):
+        p = self._index(key)
+        if p < 0:
+            raise KeyError(key)
+        self.data[p] = value
+
+    def __delitem__(self, key):
+        if not self.skip_zeros:
+            raise TypeError('entries can only be deleted with skip_zeros')
+        self[key] = 0
+
+    def __contains__(self, key):
+        return self._index(key) >= 0
+
+    def _live(self):
+        """keys and values as lists of python ints"""
+        values = self.data[self.pos]
+        if self.skip_zeros:
+            mask = values != 0
+            return self.cols[mask].tolist(), values[mask].tolist()
+        return self.cols.tolist(), values.tolist()
+
+    def __iter__(self):
+        return iter(self._live()[0])
+
+    def __len__(self):
+        if self.skip_zeros:
+            return int(np.count_nonzero(self.data[self.pos]))
+        return len(self.cols)
+
+    def keys(self):
+        return self._live()[0]
+
+    def values(self):
+        return self._live()[1]
+
+    def items(self):
+        return list(zip(*self._live()))
+
+
+class VideoView(Video):
+    """Video backed by the arrays of an ArrayDataCenter"""
+    __slots__ = ('dc',)
+
+    def __init__(self, dc, id):
+        self.dc = dc
+        self.id = id
+
+    @property
+    def size(self):
+        return int(self.dc.sizes[self.id])
+
+    @property
+    def tot_requests(self):
+        return int(self.dc.tot_requests[self.id])
+
+    @property
+    def requests(self):
+        dc = self.dc
+        start, end = dc.req_ptr[self.id], dc.req_ptr[self.id + 1]
+        return CSRRow(dc.req_ep[start:end], np.arange(start, end), dc.req_n)
+
+
+class VideoList(Sequence):
+    """list of videos, the views are created when they are accessed"""
+    __slots__ = ('dc',)
+
+    def __init__(self, dc):
+        self.dc = dc
+
+    def __getitem__(self, id):
+        if not -len(self) <= id < len(self):
+            raise IndexError(id)
+        return VideoView(self.dc, id % len(self))
+
+    def __len__(self):
+        return len(self.dc.sizes)
+
+
+class ArrayDataCenter(DataCenter):
+    """
+    DataCenter stored as arrays:
+        sizes       -- size of each video
+        ep_lat      -- data center latency of each end point
+        capacities  -- capacity of each cache server
+        links       -- (end point, server, latency) of each connection
+        req_ep, req_n -- requests by video, in the order of the input
+    r_decrps is the number of request lines read, len(reqs) if not given
+    """
+    def __init__(self, sizes, ep_lat, capacities, links, reqs, r_decrps=None):
+        self.sizes = np.asarray(sizes, dtype=np.int32)
+        self.ep_lat = np.asarray(ep_lat, dtype=np.int32)
+        self.capacities = np.asarray(capacities, dtype=np.int32)
+        links = np.asarray(links, dtype=np.int32).reshape(-1, 3)
+        reqs = np.array(reqs, dtype=np.int64).reshape(-1, 3)
+        n_videos, n_e_points = len(self.sizes), len(self.ep_lat)
+        n_servers = len(self.capacities)
+
+        # A repeated (video, end point) keeps its first position and the
+        # sum of the requests, like the dicts filled by read_in_file
+        if r_decrps is None:
+            r_decrps = len(reqs)
+        key = reqs[:, 0] * n_e_points + reqs[:, 1]
+        order = np.argsort(key, kind='stable')
+        new = np.append(True, key[order][1:] != key[order][:-1])
+        if not new.all():
+            starts = np.flatnonzero(new)
+            reqs[order[starts], 2] = np.add.reduceat(reqs[order, 2], starts)
+            reqs = reqs[np.sort(order[starts])]
+
+        # Requests by video, in the order of the input
+        self.req_ptr, order = csr(reqs[:, 0], n_videos)
+        reqs = reqs[order]
+        self.req_ep = reqs[:, 1].astype(np.int32)
+        self.req_n = reqs[:, 2].astype(np.int32)
+
+        # Same requests by end point (input order), ep_req_pos points to
+        # req_n so both sides share the counts
+        input_order = np.argsort(order, kind='stable')
+        self.ep_req_ptr, by_ep = csr(reqs[input_order, 1], n_e_points)
+        self.ep_req_pos = input_order[by_ep]
+        self.ep_req_video = reqs[self.ep_req_pos, 0].astype(np.int32)
+
+        # Connections by server and by end point
+        link_ep, link_server = links[:, 0], links[:, 1]
+        self.link_lat = links[:, 2].copy()
+        self.srv_ptr, self.srv_pos = csr(link_server, n_servers)
+        self.srv_ep = link_ep[self.srv_pos]
+        self.ep_link_ptr, self.ep_link_pos = csr(link_ep, n_e_points)
+        self.ep_link_server = link_server[self.ep_link_pos]
+
+        self.tot_requests = np.zeros(n_videos, dtype=np.int64)
+
+        servers = []
+        for id in range(n_servers):
+            server = Server(id, int(self.capacities[id]))
+            start, end = self.srv_ptr[id], self.srv_ptr[id + 1]
+            server.e_points = CSRRow(self.srv_ep[start:end],
+                                     self.srv_pos[start:end], self.link_lat)
+            servers.append(server)
+
+        e_points = []
+        for id in range(n_e_points):
+            e_point = Endpoint(id, int(self.ep_lat[id]))
+            start, end = self.ep_req_ptr[id], self.ep_req_ptr[id + 1]
+            e_point.requests = CSRRow(self.ep_req_video[start:end],
+                                      self.ep_req_pos[start:end], self.req_n,
+                                      skip_zeros=True)
+            start, end = self.ep_link_ptr[id], self.ep_link_ptr[id + 1]
+            e_point.servers = CSRRow(self.ep_link_server[start:end],
+                                     self.ep_link_pos[start:end],
+                                     self.link_lat)
+            e_points.append(e_point)
+
+        super(ArrayDataCenter, self).__init__(servers, VideoList(self),
+                                              e_points, r_decrps)
+
+    def act_tot_requests(self):
+        """complete the variable tot_requests of all the videos"""
+        self.tot_requests = np.add.reduceat(
+            np.append(self.req_n, 0).astype(np.int64), self.req_ptr[:-1])
+        self.tot_requests[self.req_ptr[:-1] == self.req_ptr[1:]] = 0
+
+    def clear_request(self, video, ep):
+        """set to 0 the requests of video from ep (both indexes share it)"""
+        video.requests[ep] = 0
+
+
+def read_in_file_arrays(filename, cache=False):
+    """read input file into an ArrayDataCenter"""
+    header, sizes, ep_lat, links, reqs = tokenize(filename, cache)
+    n_servers, cap = header[3], header[4]
+
+    return ArrayDataCenter(sizes, ep_lat, [cap] * n_servers, links, reqs)
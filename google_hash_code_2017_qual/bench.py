@@ -0,0 +1,257 @@
+"""
+Benchmarks of the loaders and the solvers.
+
+    python3 bench.py load trending_today.in
+    python3 bench.py parse *.in
+    python3 bench.py scale greedy small official 2x 5x 10x
+
+Each loader runs in its own process so the peak RSS of one does not hide the
+other. 'kept' is the memory held by the loaded DataCenter and 'peak' the
+highest memory use while loading (both from tracemalloc).
+
+scale generates (once) the inputs of generator.PRESETS with seed 0 in
+.cache/bench/ and times read_in_file, the solver and write_solution for each
+one in its own process. The times, peak RSS and score are appended to
+bench_results.csv so the runs can be compared over time.
+"""
+import csv
+import datetime
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+RESULTS = 'bench_results.csv'
+FIELDS = ('date', 'preset', 'solver', 'videos', 'endpoints', 'requests',
+          'caches', 'capacity', 'read_s', 'solve_s', 'write_s', 'rss_mb',
+          'score')
+
+
+def get_loaders():
+    """name -> function(filename) returning a DataCenter"""
+    import arrays
+    import fastio
+    import stream
+    import videos
+
+    return {
+        'objects': videos.read_in_file,
+        'fast': fastio.read_in_file_fast,
+        'arrays': arrays.read_in_file_arrays,
+        'snapshot': partial(arrays.read_in_file_arrays, cache=True),
+        'stream': stream.read_in_file_stream,
+    }
+
+
+def measure_load(loader, filename):
+    """
+    load time (s), peak RSS (MB) and traced memory kept by the DataCenter and
+    traced peak while loading (MB) of one loader
+    """
+    load = get_loaders()[loader]
+
+    start = time.perf_counter()
+    dc = load(filename)
+    elapsed = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    del dc
+
+    # Second load traced, tracemalloc slows it down too much to time it
+    tracemalloc.start()
+    dc = load(filename)
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, rss, kept / 2**20, peak / 2**20
+
+
+def bench_load(filename):
+    print('{:<10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'loader', 'time (s)', 'RSS (MB)', 'kept (MB)', 'peak (MB)'))
+    for loader in get_loaders():
+        out = subprocess.run([sys.executable, __file__, '_load', loader,
+                              filename], stdout=subprocess.PIPE, check=True)
+        print('{:<10} {:>10.3f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            loader, *map(float, out.stdout.split())))
+
+
+def same_datacenter(a, b):
+    """True if both DataCenters have the same objects (and dict orders)"""
+    state = lambda objs: [[getattr(o, attr) for attr in o.__slots__]
+                          for o in objs]
+    return all(state(getattr(a, attr)) == state(getattr(b, attr))
+               for attr in ('servers', 'videos', 'e_points'))
+
+
+def bench_parse(filenames, repeat=3):
+    """parse throughput of read_in_file against read_in_file_fast"""
+    import fastio
+    import videos
+
+    print('{:<28} {:>8} {:>10} {:>10} {:>12} {:>5}'.format(
+        'file', 'loader', 'time (s)', 'MB/s', 'lines/s', 'same'))
+    for filename in filenames:
+        with open(filename, 'rb') as fn:
+            data = fn.read()
+        mb, lines = len(data) / 2**20, data.count(b'\n')
+
+        results = {}
+        for name, load in (('objects', videos.read_in_file),
+                           ('fast', fastio.read_in_file_fast),
+                           ('tokenize', fastio.tokenize),
+                           ('snapshot', partial(fastio.tokenize, cache=True))):
+            best = float('inf')
+            for __ in range(repeat):
+                start = time.perf_counter()
+                results[name] = load(filename)
+                best = min(best, time.perf_counter() - start)
+
+            same = '-'
+            if name == 'fast':
+                same = 'yes' if same_datacenter(results['objects'],
+                                                results['fast']) else 'NO'
+            print('{:<28} {:>8} {:>10.3f} {:>10.1f} {:>12.0f} {:>5}'.format(
+                filename, name, best, mb / best, lines / best, same))
+
+
+def measure_scale(solver, in_file):
+    """times of each phase, peak RSS and score of solving one input"""
+    from score import score
+    from videos import SOLVERS, read_in_file, write_solution
+
+    times = []
+    start = time.perf_counter()
+    dc = read_in_file(in_file)
+    times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    result = SOLVERS[solver](dc)
+    times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    write_solution(in_file + '.out', result)
+    times.append(time.perf_counter() - start)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    del dc
+    return {
+        'read_s': round(times[0], 3),
+        'solve_s': round(times[1], 3),
+        'write_s': round(times[2], 3),
+        'rss_mb': round(rss, 1),
+        'score': score(read_in_file(in_file), result).score,
+    }
+
+
+def bench_scale(solver, presets):
+    from generator import PRESETS, generate
+
+    folder = os.path.join('.cache', 'bench')
+    os.makedirs(folder, exist_ok=True)
+    new_file = not os.path.exists(RESULTS)
+
+    with open(RESULTS, 'a', newline='') as fn:
+        writer = csv.DictWriter(fn, FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        for preset in presets or PRESETS:
+            in_file = os.path.join(folder, preset + '.in')
+            if not os.path.exists(in_file):
+                generate(in_file, *PRESETS[preset])
+
+            out = subprocess.run([sys.executable, __file__, '_scale', solver,
+                                  in_file], stdout=subprocess.PIPE, check=True)
+            row = json.loads(out.stdout.decode().splitlines()[-1])
+            row.update(zip(FIELDS[3:8], PRESETS[preset]), preset=preset,
+                       solver=solver,
+                       date=datetime.datetime.now().isoformat(timespec='seconds'))
+            writer.writerow(row)
+            fn.flush()
+            print(', '.join('{}={}'.format(k, row[k]) for k in FIELDS))
+
+
+def bench_model(filename, repeat=5):
+    """
+    memory kept by the objects of read_in_file and time of the attribute
+    accesses and connection lookups the solvers do most
+    """
+    from videos import get_result, get_result_lazy, read_in_file
+
+    tracemalloc.start()
+    dc = read_in_file(filename)
+    kept = tracemalloc.get_traced_memory()[0] / 2**20
+    tracemalloc.stop()
+
+    def attributes():
+        total = 0
+        for video in dc.videos:
+            total += video.size + video.tot_requests
+        for e_point in dc.e_points:
+            total += e_point.lat
+        for server in dc.servers:
+            total += server.capacity + server.space_ocupied
+        return total
+
+    def lookups():
+        found = 0
+        for server in dc.servers:
+            for e_point in dc.e_points:
+                if server.e_points.get(e_point.id) is not None:
+                    found += 1
+        return found
+
+    def best(func):
+        times = []
+        for __ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        return min(times)
+
+    accesses = len(dc.videos)*2 + len(dc.e_points) + len(dc.servers)*2
+    print('{}: {:.1f} MB kept by the objects'.format(filename, kept))
+    print('attributes  {:8.1f} ns/access'.format(
+        best(attributes) / accesses * 1e9))
+    print('lookups     {:8.1f} ns/lookup'.format(
+        best(lookups) / (len(dc.servers)*len(dc.e_points)) * 1e9))
+    for solver in (get_result, get_result_lazy):
+        start = time.perf_counter()
+        solver(read_in_file(filename))
+        elapsed = time.perf_counter() - start
+
+        # Peak memory of the solver alone, in another run (tracemalloc slows
+        # it down)
+        dc = read_in_file(filename)
+        tracemalloc.start()
+        solver(dc)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+        print('{:<16}{:8.3f} s {:8.1f} MB peak'.format(solver.__name__,
+                                                      elapsed, peak))
+
+
+if __name__ == '__main__':
+    command, args = sys.argv[1], sys.argv[2:]
+
+    if command == 'load':
+        for filename in args:
+            print(filename)
+            bench_load(filename)
+    elif command == 'parse':
+        bench_parse(args)
+    elif command == 'model':
+        for filename in args:
+            bench_model(filename)
+    elif command == 'scale':
+        bench_scale(args[0], args[1:])
+    elif command == '_scale':
+        print(json.dumps(measure_scale(*args)))
+    elif command == '_load':
+        # The numpy import is done before measuring in all the loaders
+        import numpy
+        print(*measure_load(*args))
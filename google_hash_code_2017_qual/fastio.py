@@ -0,0 +1,155 @@
+"""
+Fast input loading.
+
+The whole file is read at once and all the integers are converted in a single
+NumPy call, then the header, video sizes, end point blocks and requests are
+sliced out of that array by offset.
+
+With cache=True the parsed arrays are also saved to a binary snapshot in
+.cache/ (next to the input file) named after the SHA-1 of the input, later
+runs memory-map it instead of parsing the text again. A changed input has
+another hash so its old snapshots are never used (and are deleted).
+Several processes may write the same snapshot at once (--portfolio on a
+cold cache): each one writes its own temporary file and moves it into
+place, they are all equal so it does not matter which one is left.
+"""
+import glob
+import os
+import tempfile
+
+import numpy as np
+
+from profiling import profiled
+from videos import DataCenter, Endpoint, Server, Video, file_sha1
+
+
+CACHE_DIR = '.cache'
+
+
+def snapshot_path(filename):
+    """path of the binary snapshot of the current content of filename"""
+    folder = os.path.join(os.path.dirname(os.path.abspath(filename)),
+                          CACHE_DIR)
+    return os.path.join(folder, '{}.{}.npy'.format(os.path.basename(filename),
+                                                   file_sha1(filename)[:16]))
+
+
+def save_snapshot(path, tokens):
+    """
+    save the tokenize arrays as one int64 array: (videos, end points,
+    requests, servers, capacity, connections), sizes, ep_lat, links, reqs
+    """
+    header, sizes, ep_lat, links, reqs = tokens
+    data = np.concatenate((list(header) + [len(links)], sizes, ep_lat,
+                           links.ravel(), reqs.ravel())).astype(np.int64)
+
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+
+    # Written with a name of its own first, so a killed run never leaves half
+    # a file and runs saving at the same time do not write the same file
+    fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp',
+                               prefix=os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as fn:
+            np.save(fn, data)
+        os.replace(tmp, path)
+    except OSError:
+        os.remove(tmp)
+        # Another run has already saved it (and it can not be replaced)
+        if not os.path.exists(path):
+            raise
+
+    # Snapshots of older contents of the file, maybe deleted by another run
+    for old in glob.glob(path.rsplit('.', 2)[0] + '.*.npy'):
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+
+
+def load_snapshot(path):
+    """tokenize arrays of a snapshot, memory mapped (read only)"""
+    data = np.load(path, mmap_mode='r')
+    n_videos, n_e_points, r_decrps, n_servers, cap, n_links = \
+        data[:6].tolist()
+
+    offsets = np.cumsum([6, n_videos, n_e_points, 3*n_links, 3*r_decrps])
+    sizes = data[offsets[0]:offsets[1]]
+    ep_lat = data[offsets[1]:offsets[2]]
+    links = data[offsets[2]:offsets[3]].reshape(-1, 3)
+    reqs = data[offsets[3]:offsets[4]].reshape(-1, 3)
+
+    return ((n_videos, n_e_points, r_decrps, n_servers, cap), sizes, ep_lat,
+            links, reqs)
+
+
+def tokenize(filename, cache=False):
+    """
+    read input file as arrays
+        cache  -- use (or write) the binary snapshot of the file
+        return -- (header, sizes, ep_lat, links, reqs) where header is
+            (videos, end points, requests, servers, capacity), links has one
+            (end point, server, latency) row per connection and reqs one
+            (video, end point, number) row per request description
+    """
+    if cache:
+        path = snapshot_path(filename)
+        try:
+            return load_snapshot(path)
+        except FileNotFoundError:
+            pass
+
+        tokens = tokenize(filename)
+        save_snapshot(path, tokens)
+        return tokens
+
+    with open(filename, 'r') as fn:
+        data = np.fromstring(fn.read(), dtype=np.int64, sep=' ')
+
+    n_videos, n_e_points, r_decrps, n_servers, cap = data[:5].tolist()
+    offset = 5
+    sizes = data[offset:offset+n_videos]
+    offset += n_videos
+
+    # End point blocks: latency, number of servers and a pair per server
+    ep_lat = np.empty(n_e_points, dtype=np.int64)
+    ep_n = np.empty(n_e_points, dtype=np.int64)
+    blocks = []
+    for id in range(n_e_points):
+        ep_lat[id], ep_n[id] = data[offset], data[offset+1]
+        blocks.append(data[offset+2:offset+2+2*ep_n[id]])
+        offset += 2 + 2*ep_n[id]
+
+    pairs = np.concatenate(blocks + [data[:0]]).reshape(-1, 2)
+    links = np.column_stack((np.repeat(np.arange(n_e_points), ep_n), pairs))
+
+    reqs = data[offset:offset+3*r_decrps]
+    if len(reqs) != 3*r_decrps:
+        raise ValueError('{}: expected {} request descriptions, found {}'.format(
+            filename, r_decrps, len(reqs)//3))
+
+    return ((n_videos, n_e_points, r_decrps, n_servers, cap), sizes, ep_lat,
+            links, reqs.reshape(-1, 3))
+
+
+@profiled('read_in_file')
+def read_in_file_fast(filename, cache=False):
+    """same as videos.read_in_file, parsing the file with tokenize"""
+    header, sizes, ep_lat, links, reqs = tokenize(filename, cache)
+    n_servers, cap = header[3], header[4]
+
+    servers = [Server(id, cap) for id in range(n_servers)]
+    videos = [Video(id, size) for id, size in enumerate(sizes.tolist())]
+    e_points = [Endpoint(id, lat) for id, lat in enumerate(ep_lat.tolist())]
+
+    for ep, s_id, s_lat in links.tolist():
+        servers[s_id].e_points[ep] = s_lat
+        e_points[ep].servers[s_id] = s_lat
+
+    for video, ep, n in reqs.tolist():
+        videos[video].requests[ep] = videos[video].requests.get(ep, 0) + n
+        e_points[ep].requests[video] = videos[video].requests[ep]
+
+    return DataCenter(servers, videos, e_points, header[2])
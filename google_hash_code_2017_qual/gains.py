@@ -0,0 +1,118 @@
+"""
+Latency saved by every (cache server, video) pair, kept in a sparse matrix.
+
+    R[v, e]  -- requests of video v from end point e (videos x end points)
+    I[e, c]  -- latency improvement of cache c for end point e, data center
+                latency minus cache latency (end points x caches)
+    G = R @ I   gain of adding video v to cache c while nothing is placed
+
+G is stored as CSR with one row per video, which is the cache x video
+matrix in CSC layout: the gains of one video are contiguous. Its pattern
+(pairs with some end point that can be served faster) never changes, after
+a placement only the row of the video is recomputed, over its end points and
+the caches of its row, from the best latency reached by each request.
+
+    python3 videos.py -s matrix trending_today.in
+"""
+import heapq
+
+import numpy as np
+from scipy import sparse
+
+from profiling import profiled
+
+
+class GainMatrix:
+    @profiled('gain_matrix')
+    def __init__(self, dc):
+        n_v, n_e, n_c = len(dc.videos), len(dc.e_points), len(dc.servers)
+        self.dc_lat = np.array([e.lat for e in dc.e_points], dtype=np.float64)
+
+        # Latency of each connection, inf if the end point is not connected
+        self.lat = np.full((n_e, n_c), np.inf)
+        for e_point in dc.e_points:
+            for s_id, s_lat in e_point.servers.items():
+                self.lat[e_point.id, s_id] = s_lat
+
+        rows, cols, data = [], [], []
+        for video in dc.videos:
+            for ep, n in video.requests.items():
+                if n:
+                    rows.append(video.id)
+                    cols.append(ep)
+                    data.append(n)
+        self.requests = sparse.csr_matrix(
+            (np.array(data, dtype=np.float64), (rows, cols)), shape=(n_v, n_e))
+        self.requests.sum_duplicates()
+
+        improvement = sparse.csr_matrix(
+            np.maximum(self.dc_lat[:, None] - self.lat, 0))
+        self.gains = (self.requests @ improvement).tocsr()
+        self.gains.sort_indices()
+
+        # Best latency of each request so far, aligned with requests.data
+        self.best = self.dc_lat[self.requests.indices]
+
+    def row(self, v):
+        """(cache ids, gains) of video v, views of the matrix"""
+        start, end = self.gains.indptr[v], self.gains.indptr[v + 1]
+        return self.gains.indices[start:end], self.gains.data[start:end]
+
+    def matrix(self):
+        """the full cache x video gain matrix (CSR copy)"""
+        return self.gains.T.tocsr()
+
+    def place(self, v, c):
+        """video v was added to cache c, update the gains of video v"""
+        start, end = self.requests.indptr[v], self.requests.indptr[v + 1]
+        eps = self.requests.indices[start:end]
+        best = np.minimum(self.best[start:end], self.lat[eps, c])
+        self.best[start:end] = best
+
+        caches, gains = self.row(v)
+        saved = best[:, None] - self.lat[np.ix_(eps, caches)]
+        gains[:] = self.requests.data[start:end] @ np.maximum(saved, 0)
+
+
+def solve(dc):
+    """
+    get_result_lazy over the gain matrix: the same placement (the heap is
+    ordered the same way), the stale entries read the gain from the matrix
+    instead of going over the requests of the video
+    """
+    matrix = GainMatrix(dc)
+    servers = dc.servers
+    sizes = np.array([video.size for video in dc.videos], dtype=np.float64)
+    max_cap = max(server.capacity for server in servers)
+
+    gains = matrix.gains
+    videos = np.repeat(np.arange(len(dc.videos)), np.diff(gains.indptr))
+    keep = (gains.data > 0) & (sizes[videos] <= max_cap)
+    heap = list(zip((-gains.data[keep] / sizes[videos[keep]]).tolist(),
+                    gains.indices[keep].tolist(), videos[keep].tolist(),
+                    np.flatnonzero(keep).tolist(),
+                    [0] * int(keep.sum())))
+    heapq.heapify(heap)
+
+    placed = [0] * len(dc.videos)
+    data = gains.data
+    while heap:
+        rate, s_id, v, k, version = heapq.heappop(heap)
+        server, video = servers[s_id], dc.videos[v]
+
+        if server.space_ocupied+video.size > server.capacity:
+            continue
+
+        # Stale entry, push it back with the gain of the matrix
+        if version != placed[v]:
+            g = data[k]
+            if g:
+                heapq.heappush(heap, (-g/video.size, s_id, v, k, placed[v]))
+            continue
+
+        dc.solution.setdefault(s_id, []).append(v)
+        server.space_ocupied += video.size
+        placed[v] += 1
+        matrix.place(v, s_id)
+
+    return [[k, v] for k, v in dc.solution.items()]
@@ -0,0 +1,76 @@
+"""
+Synthetic input files, in the same format as the official ones.
+
+    python3 generator.py out.in --videos 10000 --endpoints 100 --requests 100000
+        --caches 100 --capacity 10000 --seed 1
+
+The same arguments and seed always give the same file. The limits of the
+statement are kept: video sizes up to 1000 MB, data center latencies from 2
+to 4000 ms, cache latencies from 1 to 500 ms (and lower than the data center
+one), up to 10000 requests per description and each (video, end point) pair
+described at most once.
+"""
+import argparse
+import random
+
+# Named sizes: (videos, end points, request descriptions, caches, capacity),
+# 'official' is the size of videos_worth_spreading.in and trending_today.in
+PRESETS = {
+    'small': (1000, 10, 10000, 10, 1000),
+    'official': (10000, 100, 100000, 100, 10000),
+    '2x': (20000, 200, 200000, 200, 10000),
+    '5x': (50000, 500, 500000, 500, 10000),
+    '10x': (100000, 1000, 1000000, 1000, 10000),
+}
+
+
+def generate(filename, videos, endpoints, requests, caches, capacity,
+             seed=0, max_size=1000, connections=10):
+    """
+    write a random input file
+        connections -- mean number of caches connected to each end point
+    """
+    rnd = random.Random(seed)
+    requests = min(requests, videos*endpoints)
+
+    with open(filename, 'w') as fn:
+        fn.write('{} {} {} {} {}\n'.format(videos, endpoints, requests,
+                                           caches, capacity))
+        fn.write(' '.join(str(rnd.randint(1, max_size))
+                          for __ in range(videos)) + '\n')
+
+        for __ in range(endpoints):
+            lat = rnd.randint(2, 4000)
+            n = min(caches, int(rnd.expovariate(1/connections)))
+            fn.write('{} {}\n'.format(lat, n))
+            for c in rnd.sample(range(caches), n):
+                fn.write('{} {}\n'.format(c, rnd.randint(1, min(500, lat-1))))
+
+        # Different (video, end point) pairs, the number of requests of each
+        # one follows a long tail like in the official inputs
+        for pair in rnd.sample(range(videos*endpoints), requests):
+            n = min(10000, int(rnd.paretovariate(0.8)))
+            fn.write('{} {} {}\n'.format(pair // endpoints, pair % endpoints,
+                                         n))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate an input file')
+    parser.add_argument('filename')
+    parser.add_argument('--preset', choices=PRESETS)
+    parser.add_argument('--videos', type=int, default=10000)
+    parser.add_argument('--endpoints', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=100000)
+    parser.add_argument('--caches', type=int, default=100)
+    parser.add_argument('--capacity', type=int, default=10000)
+    parser.add_argument('--connections', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.preset:
+        args.videos, args.endpoints, args.requests, args.caches, \
+            args.capacity = PRESETS[args.preset]
+
+    generate(args.filename, args.videos, args.endpoints, args.requests,
+             args.caches, args.capacity, args.seed,
+             connections=args.connections)
@@ -0,0 +1,198 @@
+"""
+Improvement of a solution by simulated annealing.
+
+    python3 optimize.py trending_today.in 60
+
+Starts from a solution (get_result_lazy by default) and tries random moves
+until the time budget (seconds) is over:
+    add     -- a video to a cache with room for it
+    remove  -- a video from a cache
+    swap    -- a video of a cache for another one that fits
+    move    -- a video from one cache to another
+Every move is evaluated with the deltas of score.Scorer. The score over time
+is printed (and returned) so the budget can be chosen for each input.
+"""
+import math
+import random
+import sys
+import time
+
+from score import score
+from videos import get_result_lazy, read_in_file, write_solution
+
+MOVES = ('add', 'remove', 'swap', 'move')
+
+# Initial temperature relative to the median change of a random move
+T0_FACTOR = 0.1
+# Random moves sampled for it, and tries to find them (most random moves
+# are not possible in a nearly full or empty solution)
+SAMPLE = 100
+SAMPLE_TRIES = 100 * SAMPLE
+
+# Random candidates tried to find a video that fits in a cache
+TRIES = 10
+
+
+def candidates(dc):
+    """videos requested from the end points of each server"""
+    cands = {}
+    for server in dc.servers:
+        videos = set()
+        for ep in server.e_points:
+            videos.update(dc.e_points[ep].requests)
+        cands[server.id] = sorted(videos)
+    return cands
+
+
+def apply(scorer, ops):
+    """apply a list of ('add' | 'remove', server, video), return the change"""
+    return sum(getattr(scorer, op)(s_id, v) for op, s_id, v in ops)
+
+
+def undo(scorer, ops):
+    """revert apply(scorer, ops)"""
+    for op, s_id, v in reversed(ops):
+        getattr(scorer, 'remove' if op == 'add' else 'add')(s_id, v)
+
+
+def random_fit(scorer, cands, s_id, room, rnd):
+    """random candidate of s_id not in it with size <= room, or None"""
+    cache, videos = scorer.cache[s_id], scorer.dc.videos
+    if not cands[s_id]:
+        return None
+    for __ in range(TRIES):
+        v = rnd.choice(cands[s_id])
+        if v not in cache and videos[v].size <= room:
+            return v
+    return None
+
+
+def random_move(scorer, cands, rnd):
+    """
+    pick a random move
+        return -- list of ('add' | 'remove', server, video) or None if the
+            move is not possible
+    """
+    kind = rnd.choice(MOVES)
+    s_id = rnd.choice(list(scorer.cache))
+    cache = scorer.cache[s_id]
+    room = scorer.servers[s_id].capacity - scorer.used[s_id]
+
+    if kind == 'add' or (kind == 'swap' and not cache):
+        v = random_fit(scorer, cands, s_id, room, rnd)
+        return None if v is None else [('add', s_id, v)]
+
+    if not cache:
+        return None
+    v = rnd.choice(tuple(cache))
+
+    if kind == 'remove':
+        return [('remove', s_id, v)]
+
+    if kind == 'swap':
+        u = random_fit(scorer, cands, s_id,
+                       room + scorer.dc.videos[v].size, rnd)
+        return None if u is None else [('remove', s_id, v), ('add', s_id, u)]
+
+    # move
+    other = rnd.choice(list(scorer.cache))
+    if other == s_id or not scorer.fits(other, v):
+        return None
+    return [('remove', s_id, v), ('add', other, v)]
+
+
+def optimize(dc, solution, budget=60, seed=None, t0=None, report=1.0,
+             verbose=True, checkpoint=None, every=10.0):
+    """
+    simulated annealing from solution, dc must be the DataCenter just read,
+    Ctrl-C stops it returning the best solution found
+        budget      -- wall clock seconds
+        t0          -- initial temperature (saved latency units), by default
+                       T0_FACTOR times the median change of a sample of
+                       random moves
+        checkpoint  -- function(solution, score) called with the best
+                       solution every 'every' seconds if it has improved
+        return      -- (best solution, [(seconds, score), ...]), at once if
+                       there are no requests (every solution scores 0) or
+                       no random move is possible
+    """
+    rnd = random.Random(seed)
+    scorer = score(dc, solution)
+    if not scorer.total:
+        return scorer.solution(), [(0.0, scorer.score)]
+    cands = candidates(dc)
+
+    if t0 is None:
+        sample = []
+        for __ in range(SAMPLE_TRIES):
+            ops = random_move(scorer, cands, rnd)
+            if ops is not None:
+                sample.append(abs(apply(scorer, ops)))
+                undo(scorer, ops)
+                if len(sample) == SAMPLE:
+                    break
+        if not sample:
+            return scorer.solution(), [(0.0, scorer.score)]
+        t0 = max(T0_FACTOR * sorted(sample)[len(sample)//2], 1)
+
+    best_saved, best_sol = scorer.saved, None
+    start = time.perf_counter()
+    history = [(0.0, scorer.score)]
+    next_report = report
+    next_checkpoint, flushed = every, best_saved
+    elapsed = 0
+
+    try:
+        while elapsed < budget:
+            elapsed = time.perf_counter() - start
+            temp = t0 * (1 - elapsed/budget)
+
+            if elapsed >= next_report:
+                history.append((elapsed, best_saved*1000 // scorer.total))
+                next_report += report
+                if verbose:
+                    print('{:8.1f}s {:>10}'.format(*history[-1]))
+
+            if checkpoint and elapsed >= next_checkpoint:
+                next_checkpoint += every
+                if best_saved > flushed:
+                    flushed = best_saved
+                    checkpoint(best_sol or scorer.solution(),
+                               best_saved*1000 // scorer.total)
+
+            ops = random_move(scorer, cands, rnd)
+            if ops is None:
+                continue
+            delta = apply(scorer, ops)
+
+            if delta >= 0 or \
+                    (temp > 0 and rnd.random() < math.exp(delta/temp)):
+                # Leaving the best solution, keep a copy of it
+                if delta < 0 and best_sol is None:
+                    undo(scorer, ops)
+                    best_sol = scorer.solution()
+                    apply(scorer, ops)
+                if scorer.saved > best_saved:
+                    best_saved, best_sol = scorer.saved, None
+            else:
+                undo(scorer, ops)
+    except KeyboardInterrupt:
+        # An interrupted move can leave the scorer half updated, but the
+        # caches never go over capacity so the solution is still valid
+        pass
+
+    if best_sol is None:
+        best_sol = scorer.solution()
+    history.append((time.perf_counter() - start,
+                    best_saved*1000 // scorer.total))
+
+    return best_sol, history
+
+
+if __name__ == '__main__':
+    in_file = sys.argv[1]
+    budget = float(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+    result = get_result_lazy(read_in_file(in_file))
+    result, history = optimize(read_in_file(in_file), result, budget)
+    write_solution(in_file + '.out', result)
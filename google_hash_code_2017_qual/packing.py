@@ -0,0 +1,71 @@
+"""
+0/1 knapsack packing of a cache server, used by get_result(dc, 'knapsack').
+
+The DP runs over the capacity with one NumPy operation per video. For big
+capacities (trending_today.in has 50000 MB) the sizes are scaled to at most
+BINS units, rounding them up so the solution always fits, and the capacity
+lost by the rounding is filled greedily afterwards.
+"""
+import numpy as np
+
+from profiling import profiled
+
+# Maximum number of capacity units of the DP
+BINS = 2048
+
+
+def knapsack(sizes, values, capacity, bins=BINS):
+    """
+    indexes of the items of the 0/1 knapsack with the biggest total value
+    (exact if capacity <= bins, else with the sizes scaled)
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    scale = max(1, -(-capacity // bins))
+    weights = -(-sizes // scale)
+    cap = capacity // scale
+
+    best = np.zeros(cap + 1)
+    take = np.zeros((len(sizes), cap + 1), dtype=bool)
+    for i, w in enumerate(weights.tolist()):
+        if w > cap:
+            continue
+        cand = best[:cap+1-w] + values[i]
+        better = cand > best[w:]
+        take[i, w:] = better
+        best[w:][better] = cand[better]
+
+    chosen, c = [], cap
+    for i in range(len(sizes) - 1, -1, -1):
+        if take[i, c]:
+            chosen.append(i)
+            c -= weights[i]
+
+    # Fill the capacity lost by the scaling by value per MB
+    room = capacity - int(sizes[chosen].sum())
+    left = sorted(set(range(len(sizes))) - set(chosen),
+                  key=lambda i: values[i]/sizes[i], reverse=True)
+    for i in left:
+        if sizes[i] <= room and values[i] > 0:
+            chosen.append(i)
+            room -= sizes[i]
+
+    return chosen
+
+
+@profiled('pack_server')
+def pack_server(server, dc):
+    """
+    videos for server chosen by knapsack over the latency they would save now
+        return -- list of (video id, latency saved), like server.req_list
+    """
+    savings = server.act_savings(dc)
+    room = server.capacity - server.space_ocupied
+    items = [(v, s) for v, s in savings.items() if dc.videos[v].size <= room]
+    if not items:
+        return []
+
+    chosen = knapsack([dc.videos[v].size for v, __ in items],
+                      [s for __, s in items], room)
+    return sorted((items[i] for i in chosen), key=lambda r: r[1],
+                  reverse=True)
@@ -0,0 +1,79 @@
+"""
+Reduction of a DataCenter before solving it (python3 videos.py --reduce).
+
+Removes in place what no solution can use:
+    - connections to caches not faster than the data center
+    - requests from end points without (useful) caches
+    - requests of videos bigger than every cache
+The ids do not change, so the solutions found for the reduced DataCenter are
+valid for the original input. The lines repeating a (video, end point) are
+already added up by the loaders, the report counts them too.
+
+The score must be computed with the original DataCenter (score.py reads the
+input again), the removed requests still count in the average.
+"""
+
+
+def reduce_problem(dc):
+    """
+    reduce dc in place (object DataCenter of read_in_file)
+        return -- dict with the number of things removed and the size before
+    """
+    servers = {server.id: server for server in dc.servers}
+    max_cap = max(server.capacity for server in dc.servers)
+    pairs = sum(len(video.requests) for video in dc.videos)
+    lines = dc.r_decrps if dc.r_decrps is not None else pairs
+
+    report = {
+        'lines': lines,
+        'duplicated_lines': lines - pairs,
+        'links': sum(len(e_point.servers) for e_point in dc.e_points),
+        'slow_links': 0,
+        'requests': pairs,
+        'useless_requests': 0,
+        'videos': sum(1 for video in dc.videos if video.requests),
+        'big_videos': 0,
+        'e_points': len(dc.e_points),
+        'e_points_without_caches': 0,
+    }
+
+    # Connections not faster than the data center
+    for e_point in dc.e_points:
+        for s_id, s_lat in list(e_point.servers.items()):
+            if s_lat >= e_point.lat:
+                del e_point.servers[s_id]
+                del servers[s_id].e_points[e_point.id]
+                report['slow_links'] += 1
+
+    # Videos that do not fit in any cache
+    big = set()
+    for video in dc.videos:
+        if video.size > max_cap and video.requests:
+            big.add(video.id)
+    report['big_videos'] = len(big)
+
+    # Requests that no cache can serve
+    for e_point in dc.e_points:
+        if not e_point.servers:
+            report['e_points_without_caches'] += 1
+        for v, n in list(e_point.requests.items()):
+            if not e_point.servers or v in big or not n:
+                del e_point.requests[v]
+                del dc.videos[v].requests[e_point.id]
+                report['useless_requests'] += 1
+
+    return report
+
+
+def print_report(report):
+    """one line summary of reduce_problem"""
+    percent = lambda part, whole: 100*part/whole if whole else 0
+    print('Reduced: {} of {} request lines were repeated, {} of {} requests '
+          '({:.1f}%) useless, {} of {} connections slow, {} of {} videos too '
+          'big, {} of {} end points without caches'.format(
+              report['duplicated_lines'], report['lines'],
+              report['useless_requests'], report['requests'],
+              percent(report['useless_requests'], report['requests']),
+              report['slow_links'], report['links'],
+              report['big_videos'], report['videos'],
+              report['e_points_without_caches'], report['e_points']))
@@ -0,0 +1,127 @@
+"""
+Instrumentation of the phases of the solver (python3 videos.py --profile).
+
+    json    -- wall time and number of calls of each phase, written as one
+               JSON object per line to <input>.profile.jsonl
+    alloc   -- same as json plus the memory allocated (net) by each phase,
+               with tracemalloc so the times are slower
+    pstats  -- cProfile of the solving process, <input>.prof (or
+               <input>.part<N>.prof with --split), for pstats or snakeviz
+
+The phases are marked with the profiled decorator or PROFILER.phase, when
+the profiler is off they only cost one attribute check.
+"""
+import cProfile
+import json
+import time
+import tracemalloc
+from functools import wraps
+
+MODES = ('json', 'alloc', 'pstats')
+
+
+class Phase:
+    """context manager that adds one call of a phase to the profiler"""
+    __slots__ = ('profiler', 'name', 'start', 'mem')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.profiler.enabled:
+            self.mem = tracemalloc.get_traced_memory()[0]
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        if self.profiler.enabled:
+            elapsed = time.perf_counter() - self.start
+            alloc = tracemalloc.get_traced_memory()[0] - self.mem
+            stat = self.profiler.stats.setdefault(self.name, [0, 0.0, 0])
+            stat[0] += 1
+            stat[1] += elapsed
+            stat[2] += alloc
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}     # phase -> [calls, seconds, allocated bytes]
+
+    def start(self, allocations=False):
+        self.enabled = True
+        self.stats = {}
+        if allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def collect(self):
+        """return the stats so far and start again from zero"""
+        stats, self.stats = self.stats, {}
+        return stats
+
+    def stop(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return self.collect()
+
+    def phase(self, name):
+        return Phase(self, name)
+
+
+PROFILER = Profiler()
+
+
+def profiled(name):
+    """decorator to count each call of the function as the phase name"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with PROFILER.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def merge(*all_stats):
+    """sum phase stats of several processes"""
+    total = {}
+    for stats in all_stats:
+        for name, values in stats.items():
+            stat = total.setdefault(name, [0, 0.0, 0])
+            for i, value in enumerate(values):
+                stat[i] += value
+    return total
+
+
+def run(mode, prof_file, func, *args):
+    """
+    run func(*args) with the instrumentation mode (None or one of MODES)
+        return -- (result, phase stats), the stats are empty without json or
+            alloc mode
+    """
+    if mode == 'pstats':
+        profile = cProfile.Profile()
+        result = profile.runcall(func, *args)
+        profile.dump_stats(prof_file)
+        return result, {}
+
+    if mode in ('json', 'alloc'):
+        PROFILER.start(allocations=mode == 'alloc')
+        try:
+            result = func(*args)
+        finally:
+            stats = PROFILER.stop()
+        return result, stats
+
+    return func(*args), {}
+
+
+def dump_json(filename, stats, **extra):
+    """write one JSON line per phase, sorted by time, with the extra fields"""
+    with open(filename, 'w') as fn:
+        for name, (calls, seconds, alloc) in sorted(
+                stats.items(), key=lambda s: s[1][1], reverse=True):
+            fn.write(json.dumps(dict(extra, phase=name, calls=calls,
+                                     seconds=round(seconds, 6),
+                                     alloc_bytes=alloc)) + '\n')
@@ -0,0 +1,161 @@
+"""
+Score of a solution, as in the statement: average time saved per request in
+microseconds (saved ms per request * 1000, rounded down).
+
+    python3 score.py trending_today.in trending_today.in.out
+
+Scorer keeps the videos of each cache server and gives the change of the
+score of adding or removing one video from one cache looking only at the
+requests of that video from the end points of that cache.
+
+The DataCenter must be the one just read (get_result clears the requests it
+serves and removes the servers from dc.servers).
+"""
+import sys
+
+from videos import read_in_file
+
+
+class Scorer:
+    def __init__(self, dc):
+        self.dc = dc
+        self.servers = {server.id: server for server in dc.servers}
+        self.cache = {id: set() for id in self.servers}
+        self.used = {id: 0 for id in self.servers}
+        self.where = [set() for __ in dc.videos]    # servers of each video
+        self.total = sum(n for video in dc.videos
+                         for n in video.requests.values())
+        self.saved = 0
+
+    @property
+    def score(self):
+        if not self.total:
+            return 0
+        return self.saved*1000 // self.total
+
+    def best_lat(self, ep, v, skip=None):
+        """best latency for the requests of v from ep (ignoring skip)"""
+        best = self.dc.e_points[ep].lat
+        for s_id in self.where[v]:
+            s_lat = self.servers[s_id].e_points.get(ep)
+            if s_id != skip and s_lat is not None and s_lat < best:
+                best = s_lat
+        return best
+
+    def fits(self, s_id, v):
+        """True if video v can be added to server s_id"""
+        return v not in self.cache[s_id] and \
+            self.used[s_id]+self.dc.videos[v].size <= \
+            self.servers[s_id].capacity
+
+    def delta_add(self, s_id, v):
+        """latency saved (total, not the score) if v is added to s_id"""
+        if v in self.cache[s_id]:
+            return 0
+        e_points = self.servers[s_id].e_points
+        delta = 0
+        for ep, n in self.dc.videos[v].requests.items():
+            s_lat = e_points.get(ep)
+            if s_lat is not None and n:
+                best = self.best_lat(ep, v)
+                if s_lat < best:
+                    delta += n*(best - s_lat)
+        return delta
+
+    def delta_remove(self, s_id, v):
+        """latency saved (negative or 0) if v is removed from s_id"""
+        if v not in self.cache[s_id]:
+            return 0
+        e_points = self.servers[s_id].e_points
+        delta = 0
+        for ep, n in self.dc.videos[v].requests.items():
+            s_lat = e_points.get(ep)
+            if s_lat is not None and n:
+                best = self.best_lat(ep, v, skip=s_id)
+                if s_lat < best:
+                    delta -= n*(best - s_lat)
+        return delta
+
+    def add(self, s_id, v):
+        """add video v to server s_id, return the change of saved latency"""
+        if s_id not in self.servers or not 0 <= v < len(self.dc.videos):
+            raise ValueError('unknown cache server {} or video {}'.format(
+                s_id, v))
+        if v in self.cache[s_id]:
+            raise ValueError('video {} twice in cache server {}'.format(
+                v, s_id))
+        if not self.fits(s_id, v):
+            raise ValueError('cache server {} over capacity: {} MB'.format(
+                s_id, self.used[s_id]+self.dc.videos[v].size))
+
+        delta = self.delta_add(s_id, v)
+        self.cache[s_id].add(v)
+        self.where[v].add(s_id)
+        self.used[s_id] += self.dc.videos[v].size
+        self.saved += delta
+        return delta
+
+    def remove(self, s_id, v):
+        """remove video v from server s_id, return the change"""
+        if v not in self.cache[s_id]:
+            raise ValueError('video {} not in cache server {}'.format(
+                v, s_id))
+
+        delta = self.delta_remove(s_id, v)
+        self.cache[s_id].remove(v)
+        self.where[v].remove(s_id)
+        self.used[s_id] -= self.dc.videos[v].size
+        self.saved += delta
+        return delta
+
+    def solution(self):
+        """solution in the format of get_result"""
+        return [[s_id, sorted(videos)] for s_id, videos in self.cache.items()
+                if videos]
+
+
+def read_solution(filename):
+    """
+    yield (server id, video ids) for each line of an output file, one line at
+    a time so big files are never held in memory
+    """
+    with open(filename, 'r') as fn:
+        n_servers = int(fn.readline())
+        lines = 0
+        for line in fn:
+            if not line.strip():
+                continue
+            s_id, *videos = map(int, line.split())
+            lines += 1
+            yield s_id, videos
+
+    if lines != n_servers:
+        raise ValueError('{}: {} cache servers announced, {} described'.format(
+            filename, n_servers, lines))
+
+
+def score(dc, solution):
+    """
+    score of a solution (get_result output or read_solution), raises
+    ValueError if it is not valid (capacity, ids, repeated servers)
+        return -- Scorer with the solution loaded
+    """
+    scorer = Scorer(dc)
+    seen = set()
+    for s_id, videos in solution:
+        if s_id in seen:
+            raise ValueError('cache server {} described twice'.format(s_id))
+        seen.add(s_id)
+        for v in videos:
+            scorer.add(s_id, v)
+    return scorer
+
+
+def score_file(in_file, out_file):
+    """score of an output file for an input file"""
+    return score(read_in_file(in_file), read_solution(out_file)).score
+
+
+if __name__ == '__main__':
+    in_file, out_file = sys.argv[1], sys.argv[2]
+    print(score_file(in_file, out_file))
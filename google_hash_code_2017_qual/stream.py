@@ -0,0 +1,120 @@
+"""
+Streaming loader for inputs too big to hold as text or as Python objects.
+
+The header, video sizes and end point blocks are read line by line (they are
+small), the request descriptions are read in blocks of CHUNK_BYTES, cut at
+the last complete line. Each block is converted with one NumPy call and
+added to the (video, end point) pairs seen so far, kept as sorted int64
+arrays (a block only adds to the number of the pairs already seen and inserts
+the new ones), so the memory used depends on the number of different pairs
+and not on the length of the file. The result is an ArrayDataCenter with the
+pairs in the order of their first line, the same as read_in_file_arrays.
+"""
+import numpy as np
+
+from arrays import ArrayDataCenter
+from profiling import profiled
+
+# Bytes of request descriptions parsed at once
+CHUNK_BYTES = 1 << 22
+
+
+def request_chunks(fn, chunk_bytes=CHUNK_BYTES):
+    """
+    generator of the request descriptions left in fn, as arrays with one
+    (video, end point, number) row per line, about chunk_bytes each
+    """
+    rest = b''
+    while True:
+        block = fn.read(chunk_bytes)
+        if not block:
+            break
+        block = rest + block
+        cut = block.rfind(b'\n') + 1
+        if not cut:
+            rest = block
+            continue
+        rest = block[cut:]
+        yield np.fromstring(block[:cut].decode(), dtype=np.int64,
+                            sep=' ').reshape(-1, 3)
+
+    if rest.strip():
+        yield np.fromstring(rest.decode(), dtype=np.int64,
+                            sep=' ').reshape(-1, 3)
+
+
+def add_requests(pairs, chunk, first_line, n_e_points):
+    """
+    add the requests of chunk to pairs
+        pairs      -- (keys, numbers, first lines) of the pairs so far, keys
+                      sorted (video*n_e_points + end point)
+        first_line -- line number of the first row of chunk
+        return     -- the new pairs
+    """
+    keys, numbers, lines = pairs
+
+    # Pairs of the chunk, added up
+    new_keys, index, inverse = np.unique(chunk[:, 0]*n_e_points + chunk[:, 1],
+                                         return_index=True,
+                                         return_inverse=True)
+    new_numbers = np.bincount(inverse, weights=chunk[:, 2],
+                              minlength=len(new_keys)).astype(np.int64)
+    new_lines = index + first_line
+
+    # Already seen pairs only add their number, the rest are inserted
+    pos = np.searchsorted(keys, new_keys)
+    seen = pos < len(keys)
+    seen[seen] = keys[pos[seen]] == new_keys[seen]
+    numbers[pos[seen]] += new_numbers[seen]
+
+    new = ~seen
+    if new.any():
+        keys = np.insert(keys, pos[new], new_keys[new])
+        numbers = np.insert(numbers, pos[new], new_numbers[new])
+        lines = np.insert(lines, pos[new], new_lines[new])
+    return keys, numbers, lines
+
+
+@profiled('read_in_file')
+def read_in_file_stream(filename, chunk_bytes=CHUNK_BYTES):
+    """read input file into an ArrayDataCenter, streaming the requests"""
+    with open(filename, 'rb') as fn:
+        n_videos, n_e_points, r_decrps, n_servers, cap = map(
+            int, fn.readline().split())
+        sizes = np.fromstring(fn.readline().decode(), dtype=np.int64, sep=' ')
+
+        ep_lat = np.empty(n_e_points, dtype=np.int64)
+        links = []
+        for id in range(n_e_points):
+            ep_lat[id], n = map(int, fn.readline().split())
+            for __ in range(n):
+                s_id, s_lat = map(int, fn.readline().split())
+                links.append((id, s_id, s_lat))
+
+        empty = np.zeros(0, dtype=np.int64)
+        pairs = (empty, empty, empty)
+        lines = 0
+        for chunk in request_chunks(fn, chunk_bytes):
+            pairs = add_requests(pairs, chunk, lines, n_e_points)
+            lines += len(chunk)
+
+    if lines != r_decrps:
+        raise ValueError('{}: expected {} request descriptions, found {}'.format(
+            filename, r_decrps, lines))
+
+    # Back to the order of the input, freeing the pairs as soon as possible
+    keys, numbers, first = pairs
+    del pairs
+    order = np.argsort(first)
+    del first
+    reqs = np.empty((len(keys), 3), dtype=np.int64)
+    reqs[:, 2] = numbers[order]
+    del numbers
+    keys = keys[order]
+    del order
+    np.floor_divide(keys, n_e_points, out=reqs[:, 0])
+    np.remainder(keys, n_e_points, out=reqs[:, 1])
+    del keys
+
+    return ArrayDataCenter(sizes, ep_lat, [cap] * n_servers, links, reqs,
+                           r_decrps)
@@ -1,7 +1,24 @@
+import argparse
+import csv
+import datetime
+import hashlib
+import heapq
+import os
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import profiling
+from profiling import PROFILER, profiled
+
 numbers = lambda st: list(map(int, st.split()))
 
 
 class Video:
+    __slots__ = ('id', 'size', 'requests', 'tot_requests')
+
     def __init__(self, id, size):
         self.id = id
         self.size = size
@@ -13,34 +30,68 @@ class Video:
             self.size, len(self.requests), self.tot_requests)
 
 class Server:
+    __slots__ = ('id', 'capacity', 'space_ocupied', 'e_points', 'lat_rate',
+                 'demand', 'req_list')
+
     def __init__(self, id, capacity):
         self.id = id
         self.capacity = capacity
         self.space_ocupied = 0
-        self.e_points = {}
+        self.e_points = {}          # end point id -> latency
         self.lat_rate = 0
-        self.requests = {}
+        self.demand = 0
         self.req_list = []
 
     def act_lat_rate(self):
         """latency rate = (total server rate)/(number of server end points)"""
+        if not self.e_points:
+            self.lat_rate = float('inf')    # useless server, the last one
+            return
         tot_lat = sum(self.e_points.values())
         self.lat_rate = tot_lat/len(self.e_points)
 
+    def act_demand(self, dc, pending):
+        """
+        demand = requests pending from the end points times the latency the
+        server saves them, pending is end point id -> requests pending
+        """
+        self.demand = 0
+        for ep, s_lat in self.e_points.items():
+            diff = dc.e_points[ep].lat - s_lat
+            if diff > 0:
+                self.demand += pending[ep]*diff
+
+    @profiled('act_reqs')
     def act_reqs(self, datacenter):
-        """actualize all the requests for each video"""
-        for video in datacenter.videos:
-            for ep, n in video.requests.items():
-                if ep in self.e_points.keys():
-                    self.requests[video.id] = self.requests.get(ep, 0) + n
-
-    def act_req_list(self, dc):
-        """a list version of requests sorted by number of requests"""
-        for k, i in self.requests.items():
-            self.req_list.append((k, i))
-
-        self.req_list = sorted(self.req_list, key=lambda r: r[1], reverse=True)
-
+        """all the requests for each video from the end points"""
+        requests = {}
+        for ep in self.e_points:
+            for v, n in datacenter.e_points[ep].requests.items():
+                requests[v] = requests.get(v, 0) + n
+        return requests
+
+    @profiled('act_req_list')
+    def act_req_list(self, dc, order='requests'):
+        """
+        list of (video id, requests) from act_reqs sorted by number of
+        requests, or by requests per MB with order='per_mb'
+        """
+        if order == 'per_mb':
+            key = lambda r: r[1]/dc.videos[r[0]].size
+        else:
+            key = lambda r: r[1]
+        self.req_list = sorted(self.act_reqs(dc).items(), key=key,
+                               reverse=True)
+
+    def act_savings(self, dc):
+        """latency saved now by each video requested from the end points"""
+        savings = {}
+        for ep, s_lat in self.e_points.items():
+            diff = dc.e_points[ep].lat - s_lat
+            if diff > 0:
+                for v, n in dc.e_points[ep].requests.items():
+                    savings[v] = savings.get(v, 0) + n*diff
+        return savings
 
     def __str__(self):
         return 'Server[{}]: {} MB and {} Endpoints'.format(self.id,
@@ -48,20 +99,26 @@ class Server:
 
 
 class Endpoint:
+    __slots__ = ('id', 'lat', 'requests', 'servers')
+
     def __init__(self, id, lat):
         self.id = id
         self.lat = lat
+        self.requests = {}      # video id -> number of requests
+        self.servers = {}       # server id -> latency
 
     def __str__(self):
         return 'Endpoint[{}]: {} latency'.format(self.id, self.lat)
 
 class DataCenter:
-    def __init__(self, servers, videos, e_points):
+    def __init__(self, servers, videos, e_points, r_decrps=None):
         self.servers = servers
         self.videos = videos
         self.e_points = e_points
+        self.r_decrps = r_decrps        # request description lines read
         self.solution = {}
 
+    @profiled('act_tot_requests')
     def act_tot_requests(self):
         """complete the variable tot_requests of all the videos"""
         for video in self.videos:
@@ -71,52 +128,100 @@ class DataCenter:
         return 'DataCenter: {} servers, {} videos, {} Endpoints'.format(
             len(self.servers), len(self.videos), len(self.e_points))
 
-def act_lat_rates(dc):
-    """sort the servers by latency rate"""
+    def clear_request(self, video, ep):
+        """
+        set to 0 the requests of video from ep, the end point index only keeps
+        the requests still pending so the entry is removed from it
+        """
+        video.requests[ep] = 0
+        self.e_points[ep].requests.pop(video.id, None)
+
+@profiled('act_lat_rates')
+def act_lat_rates(dc, order='latency', noise=None):
+    """
+    sort the servers by latency rate, or by demand per MB (highest first)
+    with order='demand'
+        noise -- server id -> factor the sort key is multiplied by
+    """
     for server in dc.servers:
         server.act_lat_rate()
-    
-    dc.servers = sorted(dc.servers, key=lambda s: s.lat_rate)
 
-def get_result(dc):
-    """add the videos to the cache servers"""
+    if order == 'demand':
+        pending = {e.id: sum(e.requests.values()) for e in dc.e_points}
+        for server in dc.servers:
+            server.act_demand(dc, pending)
+        key = lambda s: -s.demand/s.capacity
+    else:
+        key = lambda s: s.lat_rate
+
+    if noise:
+        dc.servers = sorted(dc.servers, key=lambda s: key(s)*noise[s.id])
+    else:
+        dc.servers = sorted(dc.servers, key=key)
+
+@profiled('get_result')
+def get_result(dc, packing='greedy', servers='latency', videos='requests',
+               seed=None):
+    """
+    add the videos to the cache servers
+        packing -- 'greedy' fills each cache by number of requests,
+                   'knapsack' solves a 0/1 knapsack over the latency saved
+                   (see packing.py, needs NumPy)
+        servers -- order of the servers, see act_lat_rates
+        videos  -- order of the videos with greedy, see act_req_list
+        seed    -- if not 0 or None, the server order keys are changed up to
+                   10% at random
+    """
+    if packing == 'knapsack':
+        from packing import pack_server
+
+    noise = None
+    if seed:
+        rnd = random.Random(seed)
+        noise = {server.id: rnd.uniform(0.9, 1.1) for server in dc.servers}
+
     dc.act_tot_requests()
-    act_lat_rates(dc)
+    act_lat_rates(dc, servers, noise)
 
     n_servers = len(dc.servers)
+    step = max(1, n_servers//10)
 
     for progress in range(len(dc.servers)):
         server = dc.servers[0]          # lowest lat_rate server
 
         # Ignore, this just prints the actual progress of the program
-        if not (progress+1)%(n_servers/10):
-            print('Progress:', str(int((progress+1)*100/n_servers))+'%',
+        if not (progress+1)%step or progress+1 == n_servers:
+            print('Progress:', str((progress+1)*100//n_servers)+'%',
                   end='\r')
 
         # Compute videos request
-        server.act_reqs(dc)
-        server.act_req_list(dc)
-
-        # Each element in req_list is a tuple (video id, number of requests)
-        for v, r in server.req_list:
-            video = dc.videos[v]
-
-            # If possible to add the video to the actual cache server
-            if server.space_ocupied+video.size <= server.capacity:
-                if not server.id in dc.solution:
-                    dc.solution[server.id] = [video.id]
-                else:
-                    dc.solution[server.id].append(video.id)
-
-                server.space_ocupied += video.size
-
-                # Delete requests from end points for the video added
-                for ep in server.e_points.keys():
-                    if ep in video.requests:
-                        video.requests[ep] = 0
+        if packing == 'knapsack':
+            server.req_list = pack_server(server, dc)
+        else:
+            server.act_req_list(dc, videos)
+
+        # Each element in req_list is a tuple (video id, number of requests
+        # or latency saved)
+        with PROFILER.phase('placement'):
+            for v, r in server.req_list:
+                video = dc.videos[v]
+
+                # If possible to add the video to the actual cache server
+                if server.space_ocupied+video.size <= server.capacity:
+                    if not server.id in dc.solution:
+                        dc.solution[server.id] = [video.id]
+                    else:
+                        dc.solution[server.id].append(video.id)
+
+                    server.space_ocupied += video.size
+
+                    # Delete requests from end points for the video added
+                    for ep in server.e_points.keys():
+                        if ep in video.requests:
+                            dc.clear_request(video, ep)
 
         dc.servers.pop(0)
-        act_lat_rates(dc)
+        act_lat_rates(dc, servers, noise)
 
     # Transform solution into list, not necesary but I did for convenience
     final_sol = []
@@ -126,6 +231,206 @@ def get_result(dc):
 
     return final_sol
 
+@profiled('get_result_lazy')
+def get_result_lazy(dc):
+    """
+    add the videos to the cache servers ranking every (server, video) pair by
+    latency saved per MB, best pair first
+
+    Each video has one entry in the heap, for the first server of its
+    ranking (pairs by latency saved per MB) with room for it, when a server
+    fills up the entry moves to the next one. Until it gets to the top of
+    the heap a video is only ranked by what it can save in its fastest
+    connections, its gains per server are computed then. Gains only go
+    down: when a video is placed its old ranking (or, if lower, what is left
+    to save) is kept as an upper bound and its gains are only updated (CELF)
+    if it gets to the top of the heap again, then only for the servers of
+    the end points whose latency improved.
+    """
+    servers = {server.id: server for server in dc.servers}
+    sizes = [video.size for video in dc.videos]
+    max_cap = max(server.capacity for server in dc.servers)
+
+    def ranking(v):
+        """heap of (-gain per MB, server) of the servers with room"""
+        size = sizes[v]
+        rank = [(-g/size, s_id) for s_id, g in gains[v].items()
+                if g and servers[s_id].space_ocupied+size <=
+                servers[s_id].capacity]
+        heapq.heapify(rank)
+        return rank
+
+    def push_next(v):
+        """push the best pair of video v left in its ranking with room"""
+        rank, size = ranks[v], sizes[v]
+        while rank:
+            rate, s_id = heapq.heappop(rank)
+            server = servers[s_id]
+            if server.space_ocupied+size <= server.capacity:
+                if v in pending:
+                    rate = max(rate, -potential[v]/size)
+                heapq.heappush(heap, (rate, s_id, v))
+                return
+
+    # Connections of each end point faster than the data center, and the
+    # most each video can save over them (its ranking until it is computed)
+    faster = {}
+    potential = {}
+    for e_point in dc.e_points:
+        faster[e_point.id] = [(s_id, e_point.lat - s_lat)
+                              for s_id, s_lat in e_point.servers.items()
+                              if s_lat < e_point.lat]
+        if not faster[e_point.id]:
+            continue
+        most = max(saved for __, saved in faster[e_point.id])
+        for v, n in e_point.requests.items():
+            if n and sizes[v] <= max_cap:
+                potential[v] = potential.get(v, 0) + n*most
+
+    # Latency saved by each video in each server, once it is computed
+    gains = {}
+    ranks = {}
+    # Best latency reached by each (end point, video) request so far
+    best = {}
+    # Improvements of the latency of the requests of each video placed since
+    # its gains were updated: [(end point, requests, old, new), ...]
+    pending = {}
+
+    heap = [(-p/sizes[v], -1, v) for v, p in potential.items()]
+    heapq.heapify(heap)
+
+    while heap:
+        rate, s_id, v = heapq.heappop(heap)
+
+        # Not computed yet (no video of it is placed)
+        if v not in gains:
+            g = gains[v] = defaultdict(int)
+            for ep, n in dc.videos[v].requests.items():
+                if n:
+                    for s2, saved in faster[ep]:
+                        g[s2] += n*saved
+            ranks[v] = ranking(v)
+            push_next(v)
+            continue
+
+        server, video = servers[s_id], dc.videos[v]
+        if server.space_ocupied+video.size > server.capacity:
+            push_next(v)
+            continue
+
+        # Upper bound, update the gains and push it back: each request only
+        # saves now down to its new latency, on the servers faster than it
+        if v in pending:
+            g = gains[v]
+            for ep, n, old, new in pending.pop(v):
+                for s2, lat2 in dc.e_points[ep].servers.items():
+                    if lat2 < old:
+                        g[s2] -= n*(old - (lat2 if lat2 > new else new))
+            ranks[v] = ranking(v)
+            push_next(v)
+            continue
+
+        dc.solution.setdefault(s_id, []).append(v)
+        server.space_ocupied += video.size
+
+        changes = []
+        for ep, s_lat in server.e_points.items():
+            n = video.requests.get(ep)
+            if n:
+                old = best.get((ep, v), dc.e_points[ep].lat)
+                if s_lat < old:
+                    best[(ep, v)] = s_lat
+                    potential[v] -= n*(old - s_lat)
+                    changes.append((ep, n, old, s_lat))
+        if changes:
+            pending[v] = changes
+        push_next(v)
+    return [[k, v] for k, v in dc.solution.items()]
+
+def get_result_matrix(dc):
+    """
+    same placement as get_result_lazy with the gains kept in a sparse matrix
+    updated with NumPy operations (see gains.py, needs SciPy)
+    """
+    from gains import solve
+    return solve(dc)
+
+# Solvers that can be chosen from the command line
+SOLVERS = {
+    'greedy': get_result,
+    'knapsack': partial(get_result, packing='knapsack'),
+    'lazy': get_result_lazy,
+    'matrix': get_result_matrix,
+    'greedy_per_mb': partial(get_result, videos='per_mb'),
+    'demand': partial(get_result, servers='demand'),
+    'demand_per_mb': partial(get_result, servers='demand', videos='per_mb'),
+}
+# Solvers that take a seed, the others give always the same result
+SEEDED = {'greedy', 'knapsack', 'greedy_per_mb', 'demand', 'demand_per_mb'}
+# Results of every portfolio run, appended
+LEADERBOARD = 'leaderboard.csv'
+LEADERBOARD_FIELDS = ('date', 'input', 'variant', 'seed', 'seconds', 'score',
+                      'best')
+
+def split_components(dc):
+    """
+    split dc in independent subproblems, the connected components of the end
+    point - cache server graph (end points without servers are left out)
+        return -- list of (DataCenter, server ids, video ids), the ids map the
+            ids of each subproblem to the ids of dc
+    """
+    n_eps = len(dc.e_points)
+    parent = list(range(n_eps + len(dc.servers)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for e_point in dc.e_points:
+        for s_id in e_point.servers:
+            parent[find(n_eps + s_id)] = find(e_point.id)
+
+    components = {}
+    for e_point in dc.e_points:
+        if e_point.servers:
+            components.setdefault(find(e_point.id), []).append(e_point)
+
+    capacity = {server.id: server.capacity for server in dc.servers}
+    parts = []
+    for eps in components.values():
+        s_ids = sorted({s for e_point in eps for s in e_point.servers})
+        v_ids = sorted({v for e_point in eps for v in e_point.requests})
+        s_map = {s: i for i, s in enumerate(s_ids)}
+        v_map = {v: i for i, v in enumerate(v_ids)}
+
+        servers = [Server(i, capacity[s]) for i, s in enumerate(s_ids)]
+        videos = [Video(i, dc.videos[v].size) for i, v in enumerate(v_ids)]
+        e_points = []
+        for id, e_point in enumerate(eps):
+            new = Endpoint(id, e_point.lat)
+            for s, s_lat in e_point.servers.items():
+                servers[s_map[s]].e_points[id] = s_lat
+                new.servers[s_map[s]] = s_lat
+            for v, n in e_point.requests.items():
+                videos[v_map[v]].requests[id] = n
+                new.requests[v_map[v]] = n
+            e_points.append(new)
+
+        parts.append((DataCenter(servers, videos, e_points), s_ids, v_ids))
+
+    return parts
+
+def merge_results(parts):
+    """join the results of split_components subproblems, [(result, s_ids, v_ids)]"""
+    final_sol = []
+    for result, s_ids, v_ids in parts:
+        for s, vs in result:
+            final_sol.append([s_ids[s], [v_ids[v] for v in vs]])
+    return final_sol
+
+@profiled('read_in_file')
 def read_in_file(filename):
     """read input file and process the data"""
     with open(filename, 'r') as fn:
@@ -154,47 +459,288 @@ def read_in_file(filename):
             for __ in range(n_servers_c):
                 s_id, s_lat = get(numbers)
                 servers[s_id].e_points[id] = s_lat
+                e_points[id].servers[s_id] = s_lat
 
-        # Complete the requests from the end points for each video
+        # Complete the requests for each video and for each end point, the
+        # lines repeating a (video, end point) are added up
         for r in range(r_decrps):
             video, ep, n = get(numbers)
-            videos[video].requests[ep] = n
+            videos[video].requests[ep] = videos[video].requests.get(ep, 0) + n
+            e_points[ep].requests[video] = videos[video].requests[ep]
 
-    return DataCenter(servers, videos, e_points)        
+    return DataCenter(servers, videos, e_points, r_decrps)        
 
 
-def write_solution(filename, result):
-    """write the soulution to the output file"""
-    with open(filename, 'w') as fn:
-        fn.write('%d\n' % len(result))
+def file_sha1(filename):
+    """hex SHA-1 of the content of filename, read in blocks of 1 MB"""
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fn:
+        for block in iter(lambda: fn.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
 
-        for r in result:
-            fn.write(str(r[0])+' ' + ' '.join([str(x) for x in r[1]]) + '\n')
 
+def write_result(fn, result):
+    """write the solution to the open file fn, in the output format"""
+    fn.write('%d\n' % len(result))
 
-if __name__ == '__main__':
+    for r in result:
+        fn.write(str(r[0])+' ' + ' '.join([str(x) for x in r[1]]) + '\n')
 
+
+@profiled('write_solution')
+def write_solution(filename, result):
+    """write the soulution to the output file"""
+    with open(filename, 'w') as fn:
+        write_result(fn, result)
+
+
+def load(in_file, cache=False):
+    """
+    read an input file, with cache the binary snapshot of fastio.py is used
+    (needs NumPy)
+    """
+    if cache:
+        from fastio import read_in_file_fast
+        return read_in_file_fast(in_file, cache=True)
+    return read_in_file(in_file)
+
+def load_reduced(in_file, cache=False, reduce=False):
+    """load, with reduce the problem is reduced with preprocess.py"""
+    datacenter = load(in_file, cache)
+    print(datacenter)
+    if reduce:
+        from preprocess import print_report, reduce_problem
+        with PROFILER.phase('reduce_problem'):
+            print_report(reduce_problem(datacenter))
+    return datacenter
+
+def solve_file(in_file, solver, cache=False, profile=None, reduce=False):
+    """
+    read and solve one input file (run in the process pool)
+        return -- (result, phase stats of profiling.run)
+    """
+    def solve():
+        datacenter = load_reduced(in_file, cache, reduce)
+        return SOLVERS[solver](datacenter)
+
+    return profiling.run(profile, in_file + '.prof', solve)
+
+def solve_until(in_file, solver, deadline_at, resume, cache=False,
+                reduce=False):
+    """
+    solve_file for the anytime mode, until the time deadline_at
+        return -- (result, {}) like solve_file
+    """
+    from anytime import solve_anytime
+
+    result = solve_anytime(in_file, SOLVERS[solver], deadline_at-time.time(),
+                           resume, load=partial(load, cache=cache),
+                           reduce=reduce)
+    return result, {}
+
+def solve_part(part, solver, profile, prof_file):
+    """solve one subproblem of split_components (run in the process pool)"""
+    return profiling.run(profile, prof_file, SOLVERS[solver], part)
+
+def solve_variant(in_file, variant, seed, cache=False, reduce=False):
+    """
+    solve and score in_file with one portfolio variant (run in the pool)
+        return -- (result, score, seconds)
+    """
+    from score import score
+
+    start = time.perf_counter()
+    solver = SOLVERS[variant]
+    if seed:
+        solver = partial(solver, seed=seed)
+    result = solver(load_reduced(in_file, cache, reduce))
+    seconds = time.perf_counter() - start
+    # The score needs the input as read, without the solver changes
+    return result, score(load(in_file, cache), result).score, seconds
+
+def run_portfolio(in_files, variants, seeds, jobs, budget=None, cache=False,
+                  reduce=False):
+    """
+    solve each input with every variant (and seeds 0..seeds-1 the SEEDED ones)
+    in parallel, the best result of each input is written to its .out file
+    and every result is appended to LEADERBOARD
+        budget -- seconds to wait for the results, the runs not finished by
+                  then are stopped and left out
+    A run that fails is reported and left out too, the rest are still ranked.
+    """
+    # multiprocessing.Pool instead of ProcessPoolExecutor, its processes can
+    # be stopped at the end of the budget
+    from multiprocessing import Pool, TimeoutError
+
+    deadline_at = None if budget is None else time.time() + budget
+    runs = [(in_file, variant, seed) for in_file in in_files
+            for variant in variants
+            for seed in (range(seeds) if variant in SEEDED else [0])]
+
+    pool = Pool(jobs)
+    try:
+        pending = [(run, pool.apply_async(solve_variant, run + (cache, reduce)))
+                   for run in runs]
+        done = {}
+        failed = 0
+        for run, job in pending:
+            timeout = (None if deadline_at is None
+                       else max(0, deadline_at - time.time()))
+            try:
+                done[run] = job.get(timeout)
+            except TimeoutError:
+                print('Out of time:', *run)
+            except Exception as error:
+                failed += 1
+                print('Failed:', *run, '-', type(error).__name__, error)
+    finally:
+        pool.terminate()
+
+    if failed:
+        print('{} of {} runs failed'.format(failed, len(runs)))
+
+    new_file = not os.path.exists(LEADERBOARD)
+    with open(LEADERBOARD, 'a', newline='') as fn:
+        writer = csv.DictWriter(fn, LEADERBOARD_FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        for in_file in in_files:
+            ranking = sorted(((score, seconds, variant, seed, result)
+                              for (f, variant, seed), (result, score, seconds)
+                              in done.items() if f == in_file),
+                             key=lambda r: (-r[0], r[1]))
+            if not ranking:
+                continue
+            write_solution(in_file + '.out', ranking[0][4])
+
+            print(in_file)
+            date = datetime.datetime.now().isoformat(timespec='seconds')
+            for i, (score, seconds, variant, seed, __) in enumerate(ranking):
+                print('  {:>8} {:7.2f} s  {}{}'.format(
+                    score, seconds, variant,
+                    ' seed {}'.format(seed) if seed else ''))
+                writer.writerow({'date': date, 'input': in_file,
+                                 'variant': variant, 'seed': seed,
+                                 'seconds': round(seconds, 3), 'score': score,
+                                 'best': int(i == 0)})
+
+def main(argv=None):
     # THE INPUT FILES MUST BE IN THE SAME FOLDER AS video.py
     kittens = 'kittens.in'
     matz = 'me_at_the_zoo.in'
     tt = 'trending_today.in'
     vws = 'videos_worth_spreading.in'
-    in_files = [vws, matz, tt, kittens]
 
-    for in_file in in_files:
-        out_file = in_file + '.out'
+    parser = argparse.ArgumentParser(
+        description='Hash Code 2017 qualification round: streaming videos')
+    parser.add_argument('in_files', nargs='*', default=[vws, matz, tt, kittens])
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='number of processes (default: all the cores)')
+    parser.add_argument('-s', '--solver', choices=sorted(SOLVERS),
+                        default='greedy')
+    parser.add_argument('--split', action='store_true',
+                        help='solve the independent parts of each input '
+                             'in parallel')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep a binary snapshot of the inputs in .cache/ '
+                             'and load it instead of the text')
+    parser.add_argument('--reduce', action='store_true',
+                        help='remove the requests and connections no '
+                             'solution can use before solving')
+    parser.add_argument('--deadline', type=float,
+                        help='anytime mode: improve the solution until this '
+                             'many seconds, keeping the best one in the .out '
+                             'file (see anytime.py)')
+    parser.add_argument('--resume', action='store_true',
+                        help='with --deadline, start from the saved state')
+    parser.add_argument('--portfolio', nargs='*', metavar='VARIANT',
+                        choices=sorted(SOLVERS),
+                        help='solve each input with these solvers (all if '
+                             'none given) and keep the best, --deadline is '
+                             'then the time budget of all the runs')
+    parser.add_argument('--seeds', type=int, default=1,
+                        help='with --portfolio, runs of each randomizable '
+                             'solver (seed 0 is the solver as is)')
+    parser.add_argument('--profile', choices=profiling.MODES,
+                        help='record the time of each phase of the solver '
+                             '(see profiling.py)')
+    args = parser.parse_args(argv)
+
+    if args.portfolio is not None and (args.split or args.profile or
+                                       args.resume):
+        parser.error('--portfolio can not be used with --split, --profile or '
+                     '--resume')
+    if args.deadline is not None and (args.split or args.profile):
+        parser.error('--deadline can not be used with --split or --profile')
+
+    if args.profile in ('json', 'alloc'):
+        PROFILER.start(allocations=args.profile == 'alloc')
+
+    if args.deadline is not None:
+        deadline_at = time.time() + args.deadline
+
+    in_files = []
+    for in_file in args.in_files:
+        if os.path.exists(in_file):
+            in_files.append(in_file)
+        else:
+            print('Missing input file:', in_file)
+
+    if args.portfolio is not None:
+        run_portfolio(in_files, args.portfolio or sorted(SOLVERS), args.seeds,
+                      args.jobs, args.deadline, args.cache, args.reduce)
+        return
+
+    with ProcessPoolExecutor(args.jobs) as pool:
+        # in file -> list of (future, server ids, video ids)
+        jobs = {}
+        # in file -> phase stats of this process
+        stats = {}
+        for in_file in in_files:
+            if args.split:
+                datacenter = load_reduced(in_file, args.cache, args.reduce)
+                jobs[in_file] = [
+                    (pool.submit(solve_part, part, args.solver, args.profile,
+                                 '{}.part{}.prof'.format(in_file, i)),
+                     s_ids, v_ids)
+                    for i, (part, s_ids, v_ids) in
+                    enumerate(split_components(datacenter))]
+            elif args.deadline is not None:
+                jobs[in_file] = [(pool.submit(solve_until, in_file,
+                                              args.solver, deadline_at,
+                                              args.resume, args.cache,
+                                              args.reduce), None, None)]
+            else:
+                jobs[in_file] = [(pool.submit(solve_file, in_file,
+                                              args.solver, args.cache,
+                                              args.profile, args.reduce),
+                                  None, None)]
+            stats[in_file] = PROFILER.collect()
+
+        for in_file, parts in jobs.items():
+            done = [(f.result(), s_ids, v_ids) for f, s_ids, v_ids in parts]
+            if args.split:
+                result = merge_results([(result, s_ids, v_ids) for
+                                        (result, __), s_ids, v_ids in done])
+            else:
+                result = done[0][0][0]
+
+            write_solution(in_file + '.out', result)
+
+            if args.profile in ('json', 'alloc'):
+                profiling.dump_json(
+                    in_file + '.profile.jsonl',
+                    profiling.merge(stats[in_file], PROFILER.collect(),
+                                    *(part_stats for (__, part_stats), __, __
+                                      in done)),
+                    input=in_file, solver=args.solver)
 
-        datacenter = read_in_file(in_file)
 
-        print(datacenter)
-        # print(datacenter.servers[0])
-        # print(datacenter.e_points[0])
-        # print(datacenter.videos[0])
-        # print(datacenter.videos[0].requests)
-
-        try:
-            result = get_result(datacenter)
-        except KeyboardInterrupt:
-            pass
-
-        write_solution(out_file, result)
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        # With --deadline the best solutions are already in the .out files
+        print('Interrupted')
@@ -1,14 +1,16 @@
 from collections import deque
 from random import randrange
-from threading import Thread
-from time import sleep
 
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.core.window import Window
+from kivy.core.text import Label as CoreLabel
 from kivy.factory import Factory
-from kivy.graphics import Color, Rectangle
-from kivy.uix.label import Label
+from kivy.graphics import Color, InstructionGroup, Rectangle
+from kivy.metrics import sp
+from kivy.properties import ListProperty, NumericProperty
 from kivy.uix.screenmanager import Screen, ScreenManager
+from kivy.uix.widget import Widget
 from kivy.utils import get_color_from_hex
 
 MOVE_UP = (-1, 0)
@@ -32,97 +34,275 @@ SPEEDS = {
             12:     0.01,
         }
 
-class Cell(Label):
-    def __init__(self, **kwargs):
-        self.row = kwargs.pop('row')
-        self.col = kwargs.pop('col')
-        self._value = None                      # State of the cell
-
-        super(Cell, self).__init__(**kwargs)
-
-        self.color = (0, 0, 0, 1)
-
-        # Add instructions rendered before
-        with self.canvas.before:
-            # Set the background color, size and position
-            self.bg_color = Color(.5, .5, 1)
-            self.rectangle = Rectangle(size=self.size, pos=self.pos)
-
-        # Update rectangle position and size
-        self.bind(pos=self.update_rect, size=self.update_rect)
-
-        # Cell colors (one per possible state)
-        self.colors = {
-            0: get_color_from_hex('#df9000'), # Wall, orange
-            1: get_color_from_hex('#00ff00'), # Food, green
-            2: get_color_from_hex('#0000ff'), # Snake, blue
-        }
-
-    def update_rect(self, intance, value):
-        self.rectangle.pos = self.pos
-        self.rectangle.size = self.size
+# Cell colors (one per possible state) and of the empty cells
+COLORS = {
+    0: get_color_from_hex('#df9000'), # Wall, orange
+    1: get_color_from_hex('#00ff00'), # Food, green
+    2: get_color_from_hex('#0000ff'), # Snake, blue
+}
+EMPTY = get_color_from_hex('#ffffff')
+
+# Seconds before the first move of a new game
+START_DELAY = 0.5
+
+# Longest time a frame can account for, after a pause the game does not run
+# all the moves it missed at once
+MAX_FRAME = 0.25
+
+# Direction of each arrow key and the direction it can not be used from
+KEYS = {
+    273: (MOVE_UP, MOVE_DOWN),          # key: UP
+    275: (MOVE_RIGHT, MOVE_LEFT),       # key: RIGHT
+    274: (MOVE_DOWN, MOVE_UP),          # key: DOWN
+    276: (MOVE_LEFT, MOVE_RIGHT),       # key: LEFT
+}
+
+
+class GameLoop:
+    """
+    Fixed timestep game loop on the Kivy clock, so everything runs in the UI
+    thread. on_tick is called once for each `step` seconds elapsed (several
+    times after a slow frame, none after a fast one), so the speed of the
+    game does not depend on the frame rate, and takes the keys buffered with
+    push with next_key. start stops the previous loop, there is never more
+    than one running.
+    """
+    def __init__(self, on_tick):
+        self.on_tick = on_tick
+        self.keys = deque()
+        self.event = None
+        self.step = 1
+        self.elapsed = 0
 
     @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self, value):
-        self._value = value
-
-        if value is None:
-            self.bg_color.rgb = get_color_from_hex('#ffffff')
-            return
-
-        self.bg_color.rgb = self.colors[value]
+    def running(self):
+        return self.event is not None
+
+    def start(self, step, delay=0):
+        """ Start the loop, the first tick after delay + step seconds """
+        self.stop()
+        self.step = step
+        self.elapsed = -delay
+        self.keys.clear()
+        self.event = Clock.schedule_interval(self.advance, 0)
+
+    def stop(self):
+        if self.event is not None:
+            self.event.cancel()
+            self.event = None
+
+    def push(self, key):
+        """ Buffer a key until the next frame """
+        self.keys.append(key)
+
+    def next_key(self):
+        """ Oldest key buffered or None """
+        return self.keys.popleft() if self.keys else None
+
+    def advance(self, dt):
+        """ Called by the clock every frame, dt seconds after the last one """
+        self.elapsed += min(dt, MAX_FRAME)
+        while self.running and self.elapsed >= self.step:
+            self.elapsed -= self.step
+            self.on_tick()
+
+
+class Board(Widget):
+    """
+    Grid of cells drawn as one group of canvas instructions, a Color and a
+    Rectangle per cell, instead of one Label widget per cell.
+
+    set only records the new value, the colors of the cells changed are
+    updated together once per frame. The text of a cell is a Rectangle with
+    the texture of the text (cached), only created for the cells that show
+    some. rows, cols, spacing and padding (left, top, right, bottom) work like
+    in GridLayout.
+
+    The empty cells are kept in a list, a cell filled is swapped with the
+    last one and removed, so random_free picks one in constant time.
+    """
+    rows = NumericProperty(1)
+    cols = NumericProperty(1)
+    spacing = NumericProperty(0)
+    padding = ListProperty([0, 0, 0, 0])
+    font_size = NumericProperty(sp(15))
+    text_color = ListProperty([1, 1, 1, 1])
+
+    # Textures of the texts drawn, shared by all the boards
+    textures = {}
+
+    def build(self, colors, empty):
+        """
+        create the cells, all empty
+            colors -- color (rgba) of each value
+            empty  -- color of the empty cells (value None)
+        """
+        self.colors = colors
+        self.empty = empty
+        self.values = [[None] * self.cols for __ in range(self.rows)]
+        self.dirty = {}
+
+        # Empty cells, and the index of each one in free
+        self.free = [(row, col) for row in range(self.rows)
+                     for col in range(self.cols)]
+        self.free_index = {cell: i for i, cell in enumerate(self.free)}
+        self.flush_trigger = Clock.create_trigger(self.flush)
+
+        self.cell_colors = []
+        self.rectangles = []
+        group = InstructionGroup()
+        for row in range(self.rows):
+            self.cell_colors.append([])
+            self.rectangles.append([])
+            for col in range(self.cols):
+                color = Color(*empty)
+                rectangle = Rectangle()
+                group.add(color)
+                group.add(rectangle)
+                self.cell_colors[row].append(color)
+                self.rectangles[row].append(rectangle)
+        self.canvas.add(group)
+
+        # Texts over the cells, (row, col) -> Rectangle
+        self.texts = {}
+        self.text_group = InstructionGroup()
+        self.canvas.add(self.text_group)
+        self.clear_text()
+
+        self.bind(pos=self.layout, size=self.layout)
+        self.layout()
+
+    def cell_size(self):
+        left, top, right, bottom = self.padding
+        return ((self.width - left - right - self.spacing*(self.cols-1)) /
+                self.cols,
+                (self.height - top - bottom - self.spacing*(self.rows-1)) /
+                self.rows)
+
+    def cell_pos(self, row, col):
+        """bottom left corner of the cell, row 0 is the top one"""
+        width, height = self.cell_size()
+        return (self.x + self.padding[0] + col*(width + self.spacing),
+                self.top - self.padding[1] - (row+1)*height -
+                row*self.spacing)
+
+    def layout(self, *args):
+        """place all the cells, after a change of size or position"""
+        size = self.cell_size()
+        for row in range(self.rows):
+            for col in range(self.cols):
+                rectangle = self.rectangles[row][col]
+                rectangle.pos = self.cell_pos(row, col)
+                rectangle.size = size
+        for row, col in self.texts:
+            self.place_text(row, col)
+
+    def get(self, row, col):
+        return self.values[row][col]
+
+    def set(self, row, col, value):
+        """change the value of a cell, drawn in the next frame"""
+        if self.values[row][col] != value:
+            if value is None:
+                self.add_free((row, col))
+            elif self.values[row][col] is None:
+                self.remove_free((row, col))
+            self.values[row][col] = value
+            self.dirty[(row, col)] = value
+            self.flush_trigger()
+
+    def add_free(self, cell):
+        self.free_index[cell] = len(self.free)
+        self.free.append(cell)
+
+    def remove_free(self, cell):
+        index = self.free_index.pop(cell)
+        last = self.free.pop()
+        if last != cell:
+            self.free[index] = last
+            self.free_index[last] = index
+
+    def random_free(self):
+        """ A random empty cell (row, col), None if there is none """
+        if not self.free:
+            return None
+        return self.free[randrange(len(self.free))]
+
+    def flush(self, *args):
+        """draw the cells changed since the last frame"""
+        for (row, col), value in self.dirty.items():
+            if value is None:
+                self.cell_colors[row][col].rgba = self.empty
+            else:
+                self.cell_colors[row][col].rgba = self.colors[value]
+        self.dirty = {}
+
+    def texture(self, text):
+        key = (text, self.font_size)
+        if key not in self.textures:
+            label = CoreLabel(text=text, font_size=self.font_size)
+            label.refresh()
+            self.textures[key] = label.texture
+        return self.textures[key]
+
+    def place_text(self, row, col):
+        """center the text rectangle of a cell in it"""
+        rectangle = self.texts[(row, col)]
+        x, y = self.cell_pos(row, col)
+        width, height = self.cell_size()
+        rectangle.pos = (x + (width - rectangle.size[0]) / 2,
+                         y + (height - rectangle.size[1]) / 2)
+
+    def set_text(self, row, col, text):
+        """write text over a cell ('' to remove it)"""
+        rectangle = self.texts.pop((row, col), None)
+        if rectangle is not None:
+            self.text_group.remove(rectangle)
+        if text:
+            texture = self.texture(text)
+            rectangle = Rectangle(texture=texture, size=texture.size)
+            self.text_group.add(rectangle)
+            self.texts[(row, col)] = rectangle
+            self.place_text(row, col)
+
+    def clear_text(self):
+        """remove all the texts"""
+        self.texts = {}
+        self.text_group.clear()
+        self.text_group.add(Color(*self.text_color))
 
-    def __repr__(self):
-        return '<Cell object in postion ({}, {}) value={}>'.format(self.row,
-            self.col, self.value)
-    
 
 class GameScreen(Screen):
     def __init__(self, **kwargs):
         super(GameScreen, self).__init__(**kwargs)
 
-        self.grid = list()
+        self.board = self.ids.board
+        self.board.build(COLORS, EMPTY)
         self.level = 1
         self.ids.level_label.text = 'Level 1'
 
-        # Generate an empty 21x21 grid
+        # Walls around the 21x21 grid
         for row in range(21):
-            self.grid.append([])
-
             for col in range(21):
-                cell = Cell(row=row, col=col)
-
-                # Add an empty cell to the actual position
-                self.ids.grid_layout.add_widget(cell)
-                self.grid[row].append(cell)
-
                 if row in [0, 20] or col in [0, 20]:
-                    self.grid[row][col].value = 0
+                    self.board.set(row, col, 0)
 
+        self.loop = GameLoop(self.play)
         self.new_game()
 
     def new_game(self):
-        self.playing = False
-        self.pushed = False
-
         self.reset()
         self.spawn_snake()
         self.spawn_food()
 
-        sleep(0.5)
         self.playing = True
-
-        thread = Thread(target=self.play).start()
+        self.loop.start(SPEEDS[self.level], delay=START_DELAY)
 
     def reset(self):
         for row in range(1, 20):
             for col in range(1, 20):
-                self.grid[row][col].value = None
-                self.grid[row][col].text = ''
+                self.board.set(row, col, None)
+        self.board.clear_text()
 
         self.snake = deque()
         self.direction = MOVE_RIGHT
@@ -136,56 +316,61 @@ class GameScreen(Screen):
             ('M','E'),
             ('E','R')
         ]):
-            self.grid[9][i+9].text = letter[0]
-            self.grid[10][i+9].text = letter[1]
+            self.board.set_text(9, i+9, letter[0])
+            self.board.set_text(10, i+9, letter[1])
 
     def spawn_snake(self):
         row = 10
 
         for col in [10, 11]:
-            self.grid[row][col].value = 2
+            self.board.set(row, col, 2)
             self.snake.append((row, col))
 
     def spawn_food(self):
-        has_value = True
-
-        while has_value:
-            coord_x = randrange(1, 20)
-            coord_y = randrange(1, 20)
-            has_value = self.grid[coord_x][coord_y].value
+        """ Put the food in a random empty cell, False if there is none """
+        cell = self.board.random_free()
+        if cell is None:
+            return False
 
-            if has_value is None:
-                self.grid[coord_x][coord_y].value = 1                        
+        self.board.set(*cell, 1)
+        return True
     
-    def play(self):
-        while self.playing:
+    def turn(self):
+        """ Take the first buffered key that is a valid turn, if any """
+        key = self.loop.next_key()
+        while key is not None:
+            if key in KEYS and self.direction != KEYS[key][1]:
+                self.direction = KEYS[key][0]
+                return
+            key = self.loop.next_key()
 
-            sleep(SPEEDS[self.level])
+    def play(self):
+        """ One move of the snake, called by the loop """
+        self.turn()
 
-            self.pushed = False
+        head_x, head_y = self.snake[-1][0], self.snake[-1][1]
+        new_x, new_y = head_x + self.direction[0], head_y + self.direction[1]
 
-            head_x, head_y = self.snake[-1][0], self.snake[-1][1]
-            new_x, new_y = head_x + self.direction[0], head_y + self.direction[1]
+        state = self.check_next(new_x, new_y)
 
-            state = self.check_next(new_x, new_y)
+        if state == -1:
+            self.playing = False
+            self.loop.stop()
+            self.game_over()
+        else:
+            self.snake.append((new_x, new_y))
 
-            if state == -1:
-                self.playing = False
-                self.game_over()
-            else:
-                self.snake.append((new_x, new_y))
+            if state == 0:
+                tail_x, tail_y = self.snake.popleft()
 
-                if state == 0:
-                    tail_x, tail_y = self.snake.popleft()
+                self.board.set(tail_x, tail_y, None)
 
-                    self.grid[tail_x][tail_y].value = None
-                
-                self.grid[new_x][new_y].value = 2
+            self.board.set(new_x, new_y, 2)
 
     def check_next(self, x, y):
-        if self.grid[x][y].value in [0, 2]:
+        if self.board.get(x, y) in [0, 2]:
             return -1
-        elif self.grid[x][y].value == 1:
+        elif self.board.get(x, y) == 1:
             self.spawn_food()
             return 1
         return 0
@@ -194,11 +379,13 @@ class GameScreen(Screen):
         if self.level < 12:
             self.level += 1
             self.ids.level_label.text = 'Level ' + str(self.level)
+            self.loop.step = SPEEDS[self.level]
 
     def decrease_level(self):
         if self.level > 1:
             self.level -= 1
             self.ids.level_label.text = 'Level ' + str(self.level)
+            self.loop.step = SPEEDS[self.level]
 
 class MainApp(App):
     def __init__(self, **kwargs):
@@ -216,23 +403,9 @@ class MainApp(App):
         return sm
 
     def on_key_down(self, window, key, *args):
-        if self.game_screen.pushed is False:
-            if key == 273:      # key:  UP
-                if self.game_screen.direction != MOVE_DOWN:
-                    self.game_screen.direction = MOVE_UP
-                    self.game_screen.pushed = True
-            elif key == 275:    # key:  RIGHT
-                if self.game_screen.direction != MOVE_LEFT:
-                    self.game_screen.direction = MOVE_RIGHT
-                    self.game_screen.pushed = True
-            elif key == 274:    # key:  DOWN
-                if self.game_screen.direction != MOVE_UP:
-                    self.game_screen.direction = MOVE_DOWN
-                    self.game_screen.pushed = True
-            elif key == 276:    # key:  LEFT
-                if self.game_screen.direction != MOVE_RIGHT:
-                    self.game_screen.direction = MOVE_LEFT
-                    self.game_screen.pushed = True
+        # The snake turns in its next move (one buffered key per move)
+        if self.game_screen.playing:
+            self.game_screen.loop.push(key)
 
 if __name__ == '__main__':
     MainApp().run()
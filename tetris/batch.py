@@ -0,0 +1,248 @@
+"""
+Many Tetris games at once, with NumPy.
+
+The boards are an N x (HEIGHT + 4) array of uint16 row masks, like the
+rows of engine.Tetris with 4 empty rows below the floor so that the 4 rows
+of a figure can always be read. The falling figures (figure, rotation, row,
+col), next figures, scores, lines and levels are arrays of N. Every
+operation (moves, rotations with the wall kicks, gravity, drops, locking and
+line clearing) is done for all the boards that are still playing with a few
+array operations, with the figures, KICKS, SCORES and levels of the engine.
+Only the row masks are kept, not the colors, nothing is drawn.
+
+A move is a placement: the figure is turned and moved to a column and
+dropped, like the autoplayer does. To measure boards x moves per second with
+random placements (and the single engine doing the same, to compare):
+
+    python3 batch.py --boards 10000 --moves 200 --seed 0
+"""
+import argparse
+import time
+from random import Random
+
+import numpy as np
+
+from engine import (BOUNDS, CENTER, FIGURES, FULL, HEIGHT, KICKS,
+                    LINES_PER_LEVEL, MAX_LEVEL, PIECES, SCORES, WIDTH, Tetris)
+
+# MASKS[figure, rotation, row offset] = row mask of the figure in column 0
+MASKS = np.zeros((len(FIGURES), 4, 4), dtype=np.int64)
+for f, figure in enumerate(PIECES):
+    for r, (masks, __) in enumerate(figure):
+        for dx, mask in masks:
+            MASKS[f, r, dx] = mask
+
+HEIGHTS = np.array([[h for h, __ in figure] for figure in BOUNDS])
+WIDTHS = np.array([[w for __, w in figure] for figure in BOUNDS])
+
+# KICK_OFFSETS[figure, rotation, k] = (row, col) offset of the k-th kick,
+# KICK_VALID tells which ones exist (there are fewer for some figures)
+MAX_KICKS = max(len(kicks) for figure in KICKS for kicks in figure)
+KICK_OFFSETS = np.zeros((len(FIGURES), 4, MAX_KICKS, 2), dtype=np.int64)
+KICK_VALID = np.zeros((len(FIGURES), 4, MAX_KICKS), dtype=bool)
+for f, figure in enumerate(KICKS):
+    for r, kicks in enumerate(figure):
+        KICK_OFFSETS[f, r, :len(kicks)] = kicks
+        KICK_VALID[f, r, :len(kicks)] = True
+
+# Score of the lines cleared at once
+LINE_SCORES = np.array([0] + [SCORES[n] for n in range(1, 5)])
+
+OFFSETS = np.arange(4)
+
+
+class TetrisBatch:
+    """
+    n games of Tetris. The operations act on the boards of idx (an array of
+    board indices, all the ones playing if it is None) and return which of
+    them succeeded, aligned with idx.
+    """
+    def __init__(self, n, seed=None):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.reset()
+
+    def reset(self):
+        n = self.n
+        self.boards = np.zeros((n, HEIGHT + 4), dtype=np.uint16)
+        self.figure = np.zeros(n, dtype=np.int64)
+        self.rotation = np.zeros(n, dtype=np.int64)
+        self.row = np.zeros(n, dtype=np.int64)
+        self.col = np.zeros(n, dtype=np.int64)
+        self.score = np.zeros(n, dtype=np.int64)
+        self.lines = np.zeros(n, dtype=np.int64)
+        self.level = np.ones(n, dtype=np.int64)
+        self.playing = np.ones(n, dtype=bool)
+        self.next_figure = self.random_figures(n)
+        self.spawn(np.arange(n))
+
+    def random_figures(self, k):
+        return self.rng.integers(len(FIGURES), size=k)
+
+    def active(self, idx=None):
+        return np.flatnonzero(self.playing) if idx is None else idx
+
+    def collides(self, idx, figure, rotation, row, col):
+        """True for the boards of idx where the figure does not fit"""
+        out = ((col < 0) | (row < 0) | (col + WIDTHS[figure, rotation] > WIDTH)
+               | (row + HEIGHTS[figure, rotation] > HEIGHT))
+        rows = np.clip(row, 0, HEIGHT)[:, None] + OFFSETS
+        masks = MASKS[figure, rotation] << np.clip(col, 0, WIDTH)[:, None]
+        hit = (self.boards[idx[:, None], rows] & masks).any(axis=1)
+        return out | hit
+
+    def spawn(self, idx):
+        """the next figures start falling, the boards where they do not fit
+        stop playing"""
+        self.figure[idx] = self.next_figure[idx]
+        self.next_figure[idx] = self.random_figures(len(idx))
+        self.rotation[idx] = 0
+        self.row[idx], self.col[idx] = CENTER
+
+        over = self.collides(idx, self.figure[idx], self.rotation[idx],
+                             self.row[idx], self.col[idx])
+        self.playing[idx[over]] = False
+
+    def place(self, rotation, row, col, idx=None):
+        """move the falling figures where they fit"""
+        idx = self.active(idx)
+        fits = ~self.collides(idx, self.figure[idx], rotation, row, col)
+        ok = idx[fits]
+        self.rotation[ok] = rotation[fits]
+        self.row[ok], self.col[ok] = row[fits], col[fits]
+        return fits
+
+    def move(self, side, idx=None):
+        """move the falling figures one row or column to side"""
+        idx = self.active(idx)
+        return self.place(self.rotation[idx], self.row[idx] + side[0],
+                          self.col[idx] + side[1], idx)
+
+    def rotate(self, idx=None):
+        """turn the falling figures, with the first wall kick that fits"""
+        idx = self.active(idx)
+        done = np.zeros(len(idx), dtype=bool)
+        figure, rotation = self.figure[idx], self.rotation[idx]
+        row, col = self.row[idx], self.col[idx]
+        for k in range(MAX_KICKS):
+            left = np.flatnonzero(~done & KICK_VALID[figure, rotation, k])
+            if not len(left):
+                break
+            dx, dy = KICK_OFFSETS[figure[left], rotation[left], k].T
+            done[left] = self.place((rotation[left] + 1) % 4, row[left] + dx,
+                                    col[left] + dy, idx[left])
+        return done
+
+    def lock(self, idx):
+        """fix the falling figures, clear the completed lines and spawn"""
+        figure, rotation = self.figure[idx], self.rotation[idx]
+        row, col = self.row[idx], self.col[idx]
+        for dx in range(4):
+            self.boards[idx, row + dx] |= (
+                MASKS[figure, rotation, dx] << col).astype(np.uint16)
+
+        rows = self.boards[idx, :HEIGHT]
+        full = rows == FULL
+        lines = full.sum(axis=1)
+        cleared = np.flatnonzero(lines)
+        if len(cleared):
+            # Full rows first (keeping the order of the rest), then emptied
+            order = np.argsort(~full[cleared], axis=1, kind='stable')
+            rows = np.take_along_axis(rows[cleared], order, axis=1)
+            rows[np.arange(HEIGHT) < lines[cleared, None]] = 0
+            self.boards[idx[cleared], :HEIGHT] = rows
+
+            self.score[idx] += LINE_SCORES[lines]
+            self.lines[idx] += lines
+            self.level[idx] = np.minimum(
+                MAX_LEVEL, 1 + self.lines[idx] // LINES_PER_LEVEL)
+        self.spawn(idx)
+
+    def step(self, idx=None):
+        """gravity: the figures move one row down, the ones that can not are
+        fixed"""
+        idx = self.active(idx)
+        moved = self.move((1, 0), idx)
+        self.lock(idx[~moved])
+        return moved
+
+    def drop(self, idx=None):
+        """move the figures down until the bottom, fix them and spawn"""
+        idx = self.active(idx)
+        falling = idx
+        while len(falling):
+            falling = falling[self.move((1, 0), falling)]
+        self.lock(idx)
+
+    def play_moves(self, rotation, col, idx=None):
+        """
+        a move in each board: turn the figure to rotation and move it to col
+        from where it is (if it fits there) and drop it
+            return -- which boards placed it as asked
+        """
+        idx = self.active(idx)
+        fits = self.place(rotation, self.row[idx], col, idx)
+        self.drop(idx)
+        return fits
+
+    def random_moves(self, idx=None):
+        """a move to a random rotation and column in each board"""
+        idx = self.active(idx)
+        rotation = self.rng.integers(4, size=len(idx))
+        width = WIDTHS[self.figure[idx], rotation]
+        col = (self.rng.random(len(idx)) * (WIDTH - width + 1)).astype(np.int64)
+        return self.play_moves(rotation, col, idx)
+
+
+def random_engine_move(engine, rnd):
+    """the move of TetrisBatch.random_moves in a single engine"""
+    rotation = rnd.randrange(4)
+    width = PIECES[engine.figure][rotation][1]
+    engine.place(rotation, engine.origin[0], rnd.randrange(WIDTH - width + 1))
+    return engine.drop()
+
+
+def benchmark(boards, moves, seed=0, single=200):
+    """
+    random moves in boards games at once, and in single games one by one
+    with the engine, print the moves per second of both
+    """
+    batch = TetrisBatch(boards, seed)
+    start = time.perf_counter()
+    done = 0
+    for __ in range(moves):
+        if not batch.playing.any():
+            break
+        done += int(batch.playing.sum())
+        batch.random_moves()
+    elapsed = time.perf_counter() - start
+    print('batch: {} boards, {} moves in {:.2f} s, {:.0f} moves/s '
+          '(lines mean {:.2f}, {} playing)'.format(
+              boards, done, elapsed, done / elapsed, batch.lines.mean(),
+              int(batch.playing.sum())))
+
+    rnd = Random(seed)
+    start = time.perf_counter()
+    done = 0
+    for __ in range(single):
+        engine = Tetris(rnd)
+        for __ in range(moves):
+            done += 1
+            if not random_engine_move(engine, rnd):
+                break
+    elapsed = time.perf_counter() - start
+    print('engine: {} boards, {} moves in {:.2f} s, {:.0f} moves/s'.format(
+        single, done, elapsed, done / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Batch Tetris simulator')
+    parser.add_argument('--boards', type=int, default=10000)
+    parser.add_argument('--moves', type=int, default=200,
+                        help='moves per board (until its game is over)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--single', type=int, default=200,
+                        help='games played with the engine to compare')
+    args = parser.parse_args()
+
+    benchmark(args.boards, args.moves, args.seed, args.single)
@@ -0,0 +1,323 @@
+"""
+Tetris game logic, without Kivy.
+
+The board is a list of 20 integers, one per row, where bit col is set if the
+cell (row, col) is filled. The figures of FIGURES are precomputed as row
+masks for each rotation (PIECES), so the collision tests, the detection of
+the completed lines and their clearing are bit operations over a few rows.
+The box of each rotation (BOUNDS) gives the bounds checks and KICKS the
+positions tried when a rotation does not fit where the figure is, so a
+figure next to a wall or to other cells can still turn.
+
+The colors of the filled cells are kept in a second grid only to draw them.
+The engine remembers which cells changed since the last call to changes(),
+GameScreen only redraws those.
+"""
+from random import Random
+
+# Size of the board
+WIDTH = 10
+HEIGHT = 20
+# Row mask of a completed line
+FULL = (1 << WIDTH) - 1
+
+# Sides of a figure
+RIGHT = (0, 1)
+DOWN = (1, 0)
+LEFT = (0, -1)
+
+# Default center position for figure spawning
+CENTER = (0, 4)
+
+# Scores
+SCORES = {
+    1: 40,
+    2: 100,
+    3: 300,
+    4: 1200,
+}
+
+# Lines to complete to go to the next level, and last level
+LINES_PER_LEVEL = 10
+MAX_LEVEL = 9
+
+# Coordinates of each posible rotation for each figure
+I = (
+    0,                                  # color
+    ((0, 0), (1, 0), (2, 0), (3, 0)),   # Standar position
+    ((0, 0), (0, 1), (0, 2), (0, 3)),   # clockwise rotation
+    ((0, 0), (1, 0), (2, 0), (3, 0)),   # inverse rotation
+    ((0, 0), (0, 1), (0, 2), (0, 3)),   # counter-clockwise position
+)
+
+J = (
+    1,
+    ((0, 1), (1, 1), (2, 0), (2, 1)),
+    ((1, 0), (2, 0), (2, 1), (2, 2)),
+    ((0, 1), (0, 2), (1, 1), (2, 1)),
+    ((1, 0), (1, 1), (1, 2), (2, 2)),
+)
+
+L = (
+    2,
+    ((0, 1), (1, 1), (2, 1), (2, 2)),
+    ((1, 0), (1, 1), (1, 2), (2, 0)),
+    ((0, 0), (0, 1), (1, 1), (2, 1)),
+    ((1, 2), (2, 0), (2, 1), (2, 2)),
+)
+
+O = (
+    3,
+    ((0, 0), (0, 1), (1, 0), (1, 1)),
+    ((0, 0), (0, 1), (1, 0), (1, 1)),
+    ((0, 0), (0, 1), (1, 0), (1, 1)),
+    ((0, 0), (0, 1), (1, 0), (1, 1)),
+)
+
+S = (
+    4,
+    ((0, 0), (1, 0), (1, 1), (2, 1)),
+    ((0, 1), (0, 2), (1, 0), (1, 1)),
+    ((0, 0), (1, 0), (1, 1), (2, 1)),
+    ((0, 1), (0, 2), (1, 0), (1, 1)),
+)
+
+T = (
+    5,
+    ((0, 0), (0, 1), (0, 2), (1, 1)),
+    ((0, 1), (1, 0), (1, 1), (2, 1)),
+    ((0, 1), (1, 0), (1, 1), (1, 2)),
+    ((0, 0), (1, 0), (1, 1), (2, 0)),
+)
+
+Z = (
+    6,
+    ((0, 0), (0, 1), (1, 1), (1, 2)),
+    ((0, 1), (1, 1), (1, 0), (2, 0)),
+    ((0, 0), (0, 1), (1, 1), (1, 2)),
+    ((0, 1), (1, 1), (1, 0), (2, 0)),
+)
+
+# Set of all possible figures
+FIGURES = (I, J, L, O, S, T, Z)
+
+
+def piece_masks(cells):
+    """
+    row masks of a figure in column 0
+        return -- (((row offset, mask), ...), width in columns)
+    """
+    rows = {}
+    for x, y in cells:
+        rows[x] = rows.get(x, 0) | 1 << y
+    return tuple(sorted(rows.items())), max(y for __, y in cells) + 1
+
+
+# PIECES[figure][rotation] = (((row offset, mask), ...), width)
+PIECES = tuple(tuple(piece_masks(cells) for cells in figure[1:])
+               for figure in FIGURES)
+
+# SHAPES[figure][rotation] = set of the cells (row, col) of the figure
+SHAPES = tuple(tuple(frozenset(cells) for cells in figure[1:])
+               for figure in FIGURES)
+
+# BOUNDS[figure][rotation] = (height, width) of the box of the figure
+BOUNDS = tuple(tuple((max(x for x, __ in cells) + 1,
+                      max(y for __, y in cells) + 1)
+                     for cells in figure[1:])
+               for figure in FIGURES)
+
+# Wall kicks of the Super Rotation System for each clockwise rotation (from
+# rotation 0, 1, 2, 3), as (row, col) offsets tried in order: SRS gives them
+# as (x, y) with y up
+SRS_KICKS = (
+    ((0, 0), (-1, 0), (-1, 1), (0, -2), (-1, -2)),
+    ((0, 0), (1, 0), (1, -1), (0, 2), (1, 2)),
+    ((0, 0), (1, 0), (1, 1), (0, -2), (1, -2)),
+    ((0, 0), (-1, 0), (-1, -1), (0, 2), (-1, 2)),
+)
+SRS_KICKS_I = (
+    ((0, 0), (-2, 0), (1, 0), (-2, -1), (1, 2)),
+    ((0, 0), (-1, 0), (2, 0), (-1, 2), (2, -1)),
+    ((0, 0), (2, 0), (-1, 0), (2, 1), (-1, -2)),
+    ((0, 0), (1, 0), (-2, 0), (1, -2), (-2, 1)),
+)
+
+
+def rotation_kicks(figure, rotation):
+    """
+    (row, col) offsets to try, in order, rotating the figure from rotation
+    to the next one
+    """
+    if FIGURES[figure] is O:
+        return ((0, 0),)
+    srs = SRS_KICKS_I if FIGURES[figure] is I else SRS_KICKS
+    kicks = [(-y, x) for x, y in srs[rotation]]
+
+    # The figures turn around their top left corner and not around their
+    # center like in SRS, the rotated one may also keep the right or the
+    # bottom side in place (an I against the right wall or the floor)
+    height, width = BOUNDS[figure][rotation]
+    new_height, new_width = BOUNDS[figure][(rotation + 1) % 4]
+    kicks += [(0, width - new_width), (height - new_height, 0)]
+    return tuple(sorted(set(kicks), key=kicks.index))
+
+
+# KICKS[figure][rotation] = ((row offset, col offset), ...)
+KICKS = tuple(tuple(rotation_kicks(figure, rotation) for rotation in range(4))
+              for figure in range(len(FIGURES)))
+
+
+class Tetris:
+    """
+    State of one game:
+        rows    -- row masks of the fixed cells
+        colors  -- color of each fixed cell (None if empty)
+        figure, rotation, origin -- falling figure (index in FIGURES) and
+            (row, col) of its top left corner
+        next_figure -- index in FIGURES of the next one
+    The figures are drawn from rnd (a Random, seeded to repeat a game) one
+    at a time or, with bag, as shuffled bags of the 7 figures.
+    """
+    def __init__(self, rnd=None, bag=False):
+        self.rnd = rnd or Random()
+        self.use_bag = bag
+        self.reset()
+
+    def reset(self):
+        """empty board and a new figure, all the cells are marked changed"""
+        self.rows = [0] * HEIGHT
+        self.colors = [[None] * WIDTH for __ in range(HEIGHT)]
+        self.score = 0
+        self.lines = 0
+        self.level = 1
+        self.playing = True
+        self.bag = []
+        self.dirty = {(row, col) for row in range(HEIGHT)
+                      for col in range(WIDTH)}
+        self.next_figure = self.random_figure()
+        self.spawn()
+
+    def random_figure(self):
+        if not self.use_bag:
+            return self.rnd.randrange(len(FIGURES))
+        if not self.bag:
+            self.bag = list(range(len(FIGURES)))
+            self.rnd.shuffle(self.bag)
+        return self.bag.pop()
+
+    def collides(self, figure, rotation, row, col):
+        """True if the figure does not fit in the board at (row, col)"""
+        height, width = BOUNDS[figure][rotation]
+        if col < 0 or row < 0 or col + width > WIDTH or row + height > HEIGHT:
+            return True
+        rows = self.rows
+        for dx, mask in PIECES[figure][rotation][0]:
+            if rows[row+dx] & mask << col:
+                return True
+        return False
+
+    def cells(self):
+        """cells (row, col) of the falling figure"""
+        row, col = self.origin
+        return [(row+x, col+y) for x, y in SHAPES[self.figure][self.rotation]]
+
+    def spawn(self):
+        """
+        the next figure starts falling from the top
+            return -- False if it does not fit (game over)
+        """
+        self.figure, self.next_figure = self.next_figure, self.random_figure()
+        self.rotation = 0
+        self.origin = CENTER
+
+        if self.collides(self.figure, 0, *CENTER):
+            self.playing = False
+            return False
+        self.dirty.update(self.cells())
+        return True
+
+    def place(self, rotation, row, col):
+        """move the falling figure if it fits, return True if it did"""
+        if self.collides(self.figure, rotation, row, col):
+            return False
+        self.dirty.update(self.cells())
+        self.rotation, self.origin = rotation, (row, col)
+        self.dirty.update(self.cells())
+        return True
+
+    def move(self, side):
+        """move the falling figure one row or column to side"""
+        return self.place(self.rotation, self.origin[0] + side[0],
+                          self.origin[1] + side[1])
+
+    def rotate(self):
+        """
+        change the falling figure to its next rotation state, moving it by
+        the first of its wall kicks that makes it fit
+        """
+        rotation = (self.rotation + 1) % 4
+        row, col = self.origin
+        for dx, dy in KICKS[self.figure][self.rotation]:
+            if self.place(rotation, row + dx, col + dy):
+                return True
+        return False
+
+    def step(self):
+        """
+        gravity: the figure moves one row down or, if it can not, it is fixed
+        and the next one spawns
+            return -- False when the game is over
+        """
+        if self.move(DOWN):
+            return True
+        self.lock()
+        return self.spawn()
+
+    def drop(self):
+        """move the figure down until the bottom, fix it and spawn the next"""
+        while self.move(DOWN):
+            pass
+        self.lock()
+        return self.spawn()
+
+    def lock(self):
+        """fix the falling figure in the board and clear the completed lines"""
+        color = FIGURES[self.figure][0]
+        masks, __ = PIECES[self.figure][self.rotation]
+        row, col = self.origin
+        for dx, mask in masks:
+            self.rows[row+dx] |= mask << col
+        for x, y in self.cells():
+            self.colors[x][y] = color
+
+        full = [row+dx for dx, __ in masks if self.rows[row+dx] == FULL]
+        if full:
+            self.clear_lines(full)
+
+    def clear_lines(self, full):
+        """remove the rows full, the rows above them fall"""
+        keep = [x for x in range(HEIGHT) if x not in full]
+        self.rows = [0] * len(full) + [self.rows[x] for x in keep]
+        self.colors = ([[None] * WIDTH for __ in full] +
+                       [self.colors[x] for x in keep])
+        # Every row above the lowest line cleared has moved
+        self.dirty.update((x, y) for x in range(max(full) + 1)
+                          for y in range(WIDTH))
+
+        self.score += SCORES[min(len(full), 4)]
+        self.lines += len(full)
+        self.level = min(MAX_LEVEL, 1 + self.lines // LINES_PER_LEVEL)
+
+    def value(self, row, col):
+        """color of the cell (row, col), figure included, None if empty"""
+        if self.playing:
+            x, y = row - self.origin[0], col - self.origin[1]
+            if (x, y) in SHAPES[self.figure][self.rotation]:
+                return FIGURES[self.figure][0]
+        return self.colors[row][col]
+
+    def changes(self):
+        """[(row, col, color)] of the cells changed since the last call"""
+        dirty, self.dirty = self.dirty, set()
+        return [(row, col, self.value(row, col)) for row, col in dirty]
@@ -0,0 +1,243 @@
+"""
+Reproducible Tetris games: replay files and headless playback.
+
+A game is fixed by the seed of its figures (and whether they come in 7
+figure bags) and by its inputs, each one recorded with the number of
+gravity ticks done before it. The replay file is binary, little endian:
+
+    HEADER  magic, version, bag, seed, ticks, score, lines, board hash
+    EVENT   tick (uint32), action (uint8), one per input until the end
+
+Playing it runs the engine as fast as it can, without Kivy or the game
+loop, and checks that the score, the lines and the hash of the final board
+are the ones recorded. To record games of the autoplayer and to check or
+time replays:
+
+    python3 replay.py record game.replay --seed 1 --pieces 500
+    python3 replay.py play game.replay [more.replay ...] --repeat 10
+
+The game (tetris.py) only saves its last game on game over if the
+environment variable TETRIS_REPLAY names the file to save it to:
+
+    TETRIS_REPLAY=last_game.replay python3 tetris.py
+"""
+import argparse
+import hashlib
+import os
+import struct
+import time
+from collections import namedtuple
+from random import Random
+
+from ai import play_move
+from engine import LEFT, RIGHT, Tetris
+
+MAGIC = b'TRPL'
+VERSION = 1
+HEADER = struct.Struct('<4sBBQIII20s')
+EVENT = struct.Struct('<IB')
+
+# File where the game saves its last game, None to not save it
+REPLAY_FILE = os.environ.get('TETRIS_REPLAY')
+
+# Inputs
+ROTATE = 0
+MOVE_LEFT = 1
+MOVE_RIGHT = 2
+DROP = 3
+
+Replay = namedtuple('Replay', 'seed bag ticks score lines hash events')
+
+
+def board_hash(engine):
+    """sha1 digest of the fixed cells and the falling and next figures"""
+    sha1 = hashlib.sha1()
+    sha1.update(struct.pack('<%dH' % len(engine.rows), *engine.rows))
+    sha1.update(bytes(255 if color is None else color
+                      for row in engine.colors for color in row))
+    sha1.update(bytes((engine.playing, engine.figure, engine.rotation,
+                       engine.origin[0], engine.origin[1],
+                       engine.next_figure)))
+    return sha1.digest()
+
+
+def apply(engine, action):
+    """apply an input to the engine, return its result"""
+    if action == ROTATE:
+        return engine.rotate()
+    elif action == MOVE_LEFT:
+        return engine.move(LEFT)
+    elif action == MOVE_RIGHT:
+        return engine.move(RIGHT)
+    elif action == DROP:
+        return engine.drop()
+    raise ValueError('unknown action {}'.format(action))
+
+
+class Recorder:
+    """
+    Engine that records the inputs of its game. It is used as the engine
+    (the attributes not defined here are the engine's), rotate, move and
+    drop are the inputs and step is the gravity tick.
+    """
+    def __init__(self, seed=None, bag=False):
+        self.seed = Random().getrandbits(32) if seed is None else seed
+        self.bag = bag
+        self.engine = Tetris(Random(self.seed), bag)
+        self.ticks = 0
+        self.events = []
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+    def record(self, action):
+        self.events.append((self.ticks, action))
+        return apply(self.engine, action)
+
+    def rotate(self):
+        return self.record(ROTATE)
+
+    def move(self, side):
+        return self.record(MOVE_LEFT if side == LEFT else MOVE_RIGHT)
+
+    def drop(self):
+        return self.record(DROP)
+
+    def step(self):
+        if not self.engine.playing:
+            return False
+        self.ticks += 1
+        return self.engine.step()
+
+    def replay(self):
+        """Replay of the game so far"""
+        engine = self.engine
+        return Replay(self.seed, self.bag, self.ticks, engine.score,
+                      engine.lines, board_hash(engine), list(self.events))
+
+
+def save(replay, filename):
+    with open(filename, 'wb') as fn:
+        fn.write(HEADER.pack(MAGIC, VERSION, replay.bag, replay.seed,
+                             replay.ticks, replay.score, replay.lines,
+                             replay.hash))
+        fn.write(b''.join(EVENT.pack(tick, action)
+                          for tick, action in replay.events))
+
+
+def load(filename):
+    with open(filename, 'rb') as fn:
+        data = fn.read()
+
+    magic, version, bag, seed, ticks, score, lines, digest = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError('{}: not a replay file (version {})'.format(
+            filename, VERSION))
+    if (len(data) - HEADER.size) % EVENT.size:
+        raise ValueError('{}: truncated replay file'.format(filename))
+
+    events = list(EVENT.iter_unpack(data[HEADER.size:]))
+    return Replay(seed, bool(bag), ticks, score, lines, digest, events)
+
+
+def play(replay):
+    """
+    play the replay headless
+        return -- (engine at the end, gravity ticks run)
+    """
+    engine = Tetris(Random(replay.seed), replay.bag)
+    ticks = 0
+    for tick, action in replay.events:
+        while ticks < tick and engine.playing:
+            engine.step()
+            ticks += 1
+        if engine.playing:
+            apply(engine, action)
+    while ticks < replay.ticks and engine.playing:
+        engine.step()
+        ticks += 1
+    return engine, ticks
+
+
+def verify(replay, name='replay'):
+    """
+    play the replay and check the final score, lines and board
+        return -- gravity ticks run
+    """
+    engine, ticks = play(replay)
+    found = (ticks, engine.score, engine.lines, board_hash(engine).hex())
+    expected = (replay.ticks, replay.score, replay.lines, replay.hash.hex())
+    errors = ['{} {} != {}'.format(field, value, recorded)
+              for field, value, recorded in zip(
+                  ('ticks', 'score', 'lines', 'board hash'), found, expected)
+              if value != recorded]
+    if errors:
+        raise ValueError('{}: the game differs from the recording: {}'.format(
+            name, ', '.join(errors)))
+    return ticks
+
+
+def record_autoplay(seed, bag=False, max_pieces=None, gravity=2):
+    """
+    Replay of a game of the autoplayer, letting the figure fall gravity
+    ticks before each move like it does in the game
+    """
+    recorder = Recorder(seed, bag)
+    pieces = 0
+    while recorder.playing and (max_pieces is None or pieces < max_pieces):
+        for __ in range(gravity):
+            recorder.step()
+        if recorder.playing:
+            play_move(recorder)
+        pieces += 1
+    return recorder.replay()
+
+
+def benchmark(filenames, repeat=1):
+    """verify the replays repeat times and print the ticks and inputs/s"""
+    replays = [(filename, load(filename)) for filename in filenames]
+    start = time.perf_counter()
+    ticks = events = 0
+    for __ in range(repeat):
+        for filename, replay in replays:
+            ticks += verify(replay, filename)
+            events += len(replay.events)
+    elapsed = time.perf_counter() - start
+
+    for filename, replay in replays:
+        print('{}: ok, score {} lines {} ticks {} inputs {}'.format(
+            filename, replay.score, replay.lines, replay.ticks,
+            len(replay.events)))
+    print('{} ticks and {} inputs in {:.2f} s: {:.0f} ticks/s, '
+          '{:.0f} inputs/s'.format(ticks, events, elapsed,
+                                   ticks / elapsed, events / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tetris replays')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    record = commands.add_parser('record',
+                                 help='record a game of the autoplayer')
+    record.add_argument('file')
+    record.add_argument('--seed', type=int, default=0)
+    record.add_argument('--bag', action='store_true',
+                        help='figures in bags of 7')
+    record.add_argument('--pieces', type=int, default=1000,
+                        help='maximum pieces (0: no limit)')
+
+    check = commands.add_parser('play', help='check and time replays')
+    check.add_argument('files', nargs='+')
+    check.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        replay = record_autoplay(args.seed, args.bag, args.pieces or None)
+        save(replay, args.file)
+        print('{}: score {} lines {} ticks {} inputs {}'.format(
+            args.file, replay.score, replay.lines, replay.ticks,
+            len(replay.events)))
+    else:
+        benchmark(args.files, args.repeat)
@@ -1,30 +1,20 @@
-from threading import Thread
-from random import choice
-from time import sleep
+from collections import deque
 
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.core.window import Window
+from kivy.core.text import Label as CoreLabel
 from kivy.factory import Factory
-from kivy.graphics import Color, Rectangle
-from kivy.uix.label import Label
+from kivy.graphics import Color, InstructionGroup, Rectangle
+from kivy.metrics import sp
+from kivy.properties import ListProperty, NumericProperty
 from kivy.uix.screenmanager import ScreenManager, Screen
+from kivy.uix.widget import Widget
 from kivy.utils import get_color_from_hex
 
-# Sides of a figure
-RIGHT = (0, 1)
-DOWN = (1, 0)
-LEFT = (0, -1)
-
-# Default center position for figure spawning
-CENTER = (0, 4)
-
-# Scores
-SCORES = {
-    1: 40,
-    2: 100,
-    3: 300,
-    4: 1200,
-}
+from ai import play_move
+from engine import FIGURES, LEFT, RIGHT
+from replay import REPLAY_FILE, Recorder, save
 
 # Speed dependng on the level
 SPEEDS = {
@@ -39,128 +29,212 @@ SPEEDS = {
     9: 0.2,
 }
 
-# Coordinates of each posible rotation for each figure
-I = (
-    0,                                  # color
-    ((0, 0), (1, 0), (2, 0), (3, 0)),   # Standar position
-    ((0, 0), (0, 1), (0, 2), (0, 3)),   # clockwise rotation
-    ((0, 0), (1, 0), (2, 0), (3, 0)),   # inverse rotation
-    ((0, 0), (0, 1), (0, 2), (0, 3)),   # counter-clockwise position
-)
-
-J = (
-    1,
-    ((0, 1), (1, 1), (2, 0), (2, 1)),
-    ((1, 0), (2, 0), (2, 1), (2, 2)),
-    ((0, 1), (0, 2), (1, 1), (2, 1)),
-    ((1, 0), (1, 1), (1, 2), (2, 2)),
-)
-
-L = (
-    2,
-    ((0, 1), (1, 1), (2, 1), (2, 2)),
-    ((1, 0), (1, 1), (1, 2), (2, 0)),
-    ((0, 0), (0, 1), (1, 1), (2, 1)),
-    ((1, 2), (2, 0), (2, 1), (2, 2)),
-)
-
-O = (
-    3,
-    ((0, 0), (0, 1), (1, 0), (1, 1)),
-    ((0, 0), (0, 1), (1, 0), (1, 1)),
-    ((0, 0), (0, 1), (1, 0), (1, 1)),
-    ((0, 0), (0, 1), (1, 0), (1, 1)),
-)
-
-S = (
-    4,
-    ((0, 0), (1, 0), (1, 1), (2, 1)),
-    ((0, 1), (0, 2), (1, 0), (1, 1)),
-    ((0, 0), (1, 0), (1, 1), (2, 1)),
-    ((0, 1), (0, 2), (1, 0), (1, 1)),
-)
-
-T = (
-    5,
-    ((0, 0), (0, 1), (0, 2), (1, 1)),
-    ((0, 1), (1, 0), (1, 1), (2, 1)),
-    ((0, 1), (1, 0), (1, 1), (1, 2)),
-    ((0, 0), (1, 0), (1, 1), (2, 0)),
-)
-
-Z = (
-    6,
-    ((0, 0), (0, 1), (1, 1), (1, 2)),
-    ((0, 1), (1, 1), (1, 0), (2, 0)),
-    ((0, 0), (0, 1), (1, 1), (1, 2)),
-    ((0, 1), (1, 1), (1, 0), (2, 0)),
-)
-
-# Set of all possible figures
-FIGURES = (I, J, L, O, S, T, Z)
-
-
-class Cell(Label):
-    """
-    This class represents the blocks of the game.
+# Speed of the autoplayer, one figure per move
+AUTOPLAY_SPEED = SPEEDS[9]
+
+# Color of the cells of each figure and of the empty cells
+COLORS = {
+    0: get_color_from_hex('#00FFFF'),  # I,      cyan
+    1: get_color_from_hex('#0000FF'),  # J,      blue
+    2: get_color_from_hex('#FFA500'),  # L,      orange
+    3: get_color_from_hex('#FFFF00'),  # O,      yellow
+    4: get_color_from_hex('#00FF00'),  # S,      lime
+    5: get_color_from_hex('#800080'),  # T,      purple
+    6: get_color_from_hex('#FF0000'),  # Z,      red
+}
+EMPTY = get_color_from_hex('#ffffff')
 
-    Basically, each block contains a value (color), a cell coordinate ((0,0),
-    (2, 3)) some properties that decides color, text to represent (if any).
-    """
-    def __init__(self, **kwargs):
-        self.row = kwargs.pop('row')
-        self.col = kwargs.pop('col')
-        self._value = None
-
-        super(Cell, self).__init__(**kwargs)
-
-        # Color of the font: black
-        self.color = (0, 0, 0, 1)
-
-        # Add instructions rendered before
-        with self.canvas.before:
-            # Set the background color, size and position
-            self.bg_color = Color(.5, .5, 1)
-            self.rectangle = Rectangle(size=self.size, pos=self.pos)
-
-        # Update rectangle position and size
-        self.bind(pos=self.update_rect, size=self.update_rect)
-
-        # Dictionary with all possible color each cell can have, one per figure
-        self.colors = {
-            0: get_color_from_hex('#00FFFF'),  # I,      cyan
-            1: get_color_from_hex('#0000FF'),  # J,      blue
-            2: get_color_from_hex('#FFA500'),  # L,      orange
-            3: get_color_from_hex('#FFFF00'),  # O,      yellow
-            4: get_color_from_hex('#00FF00'),  # S,      lime
-            5: get_color_from_hex('#800080'),  # T,      purple
-            6: get_color_from_hex('#FF0000'),  # Z,      red
-        }
-
-    def update_rect(self, instance, value):
-        self.rectangle.pos = self.pos
-        self.rectangle.size = self.size
+# Seconds before the first move of a new game
+START_DELAY = 1
 
-    @property
-    def value(self):
-        return self._value
+# Longest time a frame can account for, after a pause the game does not run
+# all the moves it missed at once
+MAX_FRAME = 0.25
 
-    @value.setter
-    def value(self, value):
-        self._value = value
 
-        # Default color (empty cell)
-        if value is None:
-            self.bg_color.rgb = get_color_from_hex('#ffffff')
-            return
+class GameLoop:
+    """
+    Fixed timestep game loop on the Kivy clock, so everything runs in the UI
+    thread. Every frame the keys buffered with push are handed to on_key and
+    then on_tick is called once for each `step` seconds elapsed (several
+    times after a slow frame, none after a fast one), so the speed of the
+    game does not depend on the frame rate. start stops the previous loop,
+    there is never more than one running.
+    """
+    def __init__(self, on_tick, on_key):
+        self.on_tick = on_tick
+        self.on_key = on_key
+        self.keys = deque()
+        self.event = None
+        self.step = 1
+        self.elapsed = 0
 
-        # Cell is part of a figure, draw the cell with the color of the figure.
-        self.bg_color.rgb = self.colors[value]
+    @property
+    def running(self):
+        return self.event is not None
+
+    def start(self, step, delay=0):
+        """ Start the loop, the first tick after delay + step seconds """
+        self.stop()
+        self.step = step
+        self.elapsed = -delay
+        self.keys.clear()
+        self.event = Clock.schedule_interval(self.advance, 0)
+
+    def stop(self):
+        if self.event is not None:
+            self.event.cancel()
+            self.event = None
+
+    def push(self, key):
+        """ Buffer a key until the next frame """
+        self.keys.append(key)
+
+    def advance(self, dt):
+        """ Called by the clock every frame, dt seconds after the last one """
+        while self.keys and self.running:
+            self.on_key(self.keys.popleft())
+
+        self.elapsed += min(dt, MAX_FRAME)
+        while self.running and self.elapsed >= self.step:
+            self.elapsed -= self.step
+            self.on_tick()
+
+
+class Board(Widget):
+    """
+    Grid of cells drawn as one group of canvas instructions, a Color and a
+    Rectangle per cell, instead of one Label widget per cell.
+
+    set only records the new value, the colors of the cells changed are
+    updated together once per frame. The text of a cell is a Rectangle with
+    the texture of the text (cached), only created for the cells that show
+    some. rows, cols, spacing and padding (left, top, right, bottom) work like
+    in GridLayout.
+    """
+    rows = NumericProperty(1)
+    cols = NumericProperty(1)
+    spacing = NumericProperty(0)
+    padding = ListProperty([0, 0, 0, 0])
+    font_size = NumericProperty(sp(15))
+    text_color = ListProperty([1, 1, 1, 1])
+
+    # Textures of the texts drawn, shared by all the boards
+    textures = {}
 
-    def __repr__(self):
-        return '<Cell object in position ({}, {}) value={}>'.format(self.row,
-                                                                    self.col,
-                                                                    self.value)
+    def build(self, colors, empty):
+        """
+        create the cells, all empty
+            colors -- color (rgba) of each value
+            empty  -- color of the empty cells (value None)
+        """
+        self.colors = colors
+        self.empty = empty
+        self.values = [[None] * self.cols for __ in range(self.rows)]
+        self.dirty = {}
+        self.flush_trigger = Clock.create_trigger(self.flush)
+
+        self.cell_colors = []
+        self.rectangles = []
+        group = InstructionGroup()
+        for row in range(self.rows):
+            self.cell_colors.append([])
+            self.rectangles.append([])
+            for col in range(self.cols):
+                color = Color(*empty)
+                rectangle = Rectangle()
+                group.add(color)
+                group.add(rectangle)
+                self.cell_colors[row].append(color)
+                self.rectangles[row].append(rectangle)
+        self.canvas.add(group)
+
+        # Texts over the cells, (row, col) -> Rectangle
+        self.texts = {}
+        self.text_group = InstructionGroup()
+        self.canvas.add(self.text_group)
+        self.clear_text()
+
+        self.bind(pos=self.layout, size=self.layout)
+        self.layout()
+
+    def cell_size(self):
+        left, top, right, bottom = self.padding
+        return ((self.width - left - right - self.spacing*(self.cols-1)) /
+                self.cols,
+                (self.height - top - bottom - self.spacing*(self.rows-1)) /
+                self.rows)
+
+    def cell_pos(self, row, col):
+        """bottom left corner of the cell, row 0 is the top one"""
+        width, height = self.cell_size()
+        return (self.x + self.padding[0] + col*(width + self.spacing),
+                self.top - self.padding[1] - (row+1)*height -
+                row*self.spacing)
+
+    def layout(self, *args):
+        """place all the cells, after a change of size or position"""
+        size = self.cell_size()
+        for row in range(self.rows):
+            for col in range(self.cols):
+                rectangle = self.rectangles[row][col]
+                rectangle.pos = self.cell_pos(row, col)
+                rectangle.size = size
+        for row, col in self.texts:
+            self.place_text(row, col)
+
+    def get(self, row, col):
+        return self.values[row][col]
+
+    def set(self, row, col, value):
+        """change the value of a cell, drawn in the next frame"""
+        if self.values[row][col] != value:
+            self.values[row][col] = value
+            self.dirty[(row, col)] = value
+            self.flush_trigger()
+
+    def flush(self, *args):
+        """draw the cells changed since the last frame"""
+        for (row, col), value in self.dirty.items():
+            if value is None:
+                self.cell_colors[row][col].rgba = self.empty
+            else:
+                self.cell_colors[row][col].rgba = self.colors[value]
+        self.dirty = {}
+
+    def texture(self, text):
+        key = (text, self.font_size)
+        if key not in self.textures:
+            label = CoreLabel(text=text, font_size=self.font_size)
+            label.refresh()
+            self.textures[key] = label.texture
+        return self.textures[key]
+
+    def place_text(self, row, col):
+        """center the text rectangle of a cell in it"""
+        rectangle = self.texts[(row, col)]
+        x, y = self.cell_pos(row, col)
+        width, height = self.cell_size()
+        rectangle.pos = (x + (width - rectangle.size[0]) / 2,
+                         y + (height - rectangle.size[1]) / 2)
+
+    def set_text(self, row, col, text):
+        """write text over a cell ('' to remove it)"""
+        rectangle = self.texts.pop((row, col), None)
+        if rectangle is not None:
+            self.text_group.remove(rectangle)
+        if text:
+            texture = self.texture(text)
+            rectangle = Rectangle(texture=texture, size=texture.size)
+            self.text_group.add(rectangle)
+            self.texts[(row, col)] = rectangle
+            self.place_text(row, col)
+
+    def clear_text(self):
+        """remove all the texts"""
+        self.texts = {}
+        self.text_group.clear()
+        self.text_group.add(Color(*self.text_color))
 
 
 class GameScreen(Screen):
@@ -173,30 +247,15 @@ class GameScreen(Screen):
     def __init__(self, **kwargs):
         super(GameScreen, self).__init__(**kwargs)
 
-        self.grid = list()
-        self.grid_aux = list()
-
-        # Generate an empty 10x20 grid and an empty 4x4 grid
-        for row in range(20):
-            self.grid.append([])
-            # For the 4x4 grid
-            if row < 4:
-                self.grid_aux.append([])
-
-            for col in range(10):
-                cell = Cell(row=row, col=col)
-
-                # Add an empty cell to the actual position, 10x20 grid
-                self.ids.grid_layout.add_widget(cell)
-                self.grid[row].append(cell)
-
-                # Same for the 4x4 grid
-                if row < 4 and col < 4:
-                    cell_aux = Cell(row=row, col=col)
-
-                    self.ids.grid_layout_aux.add_widget(cell_aux)
-                    self.grid_aux[row].append(cell_aux)
+        # The 10x20 grid and the 4x4 grid of the next figure
+        self.board = self.ids.board
+        self.board.build(COLORS, EMPTY)
+        self.board_aux = self.ids.board_aux
+        self.board_aux.build(COLORS, EMPTY)
 
+        # The autoplayer (ai.py) plays instead of the keys
+        self.autoplay = False
+        self.loop = GameLoop(self.tick, self.on_key)
         self.new_game()
 
     def new_game(self):
@@ -205,14 +264,17 @@ class GameScreen(Screen):
         pressing the New Game buttom
         """
         self.reset()
-        self.playing = False
-        sleep(1)
         self.playing = True
-        Thread(target=self.play).start()
+        self.loop.start(self.speed(), delay=START_DELAY)
 
     def game_over(self):
         """Clean the grid and show the text 'GAME OVER' in the auxiliar grid"""
-        self.reset()
+        self.playing = False
+        self.loop.stop()
+        # python3 replay.py play REPLAY_FILE plays it again
+        if REPLAY_FILE:
+            save(self.engine.replay(), REPLAY_FILE)
+        self.clear()
 
         # Draw 'GAME OVER' in the auxiliar grid
         for i, letter in enumerate([
@@ -221,211 +283,97 @@ class GameScreen(Screen):
             ('M', 'E'),
             ('E', 'R')
         ]):
-            self.grid_aux[1][i].text = letter[0]
-            self.grid_aux[2][i].text = letter[1]
+            self.board_aux.set_text(1, i, letter[0])
+            self.board_aux.set_text(2, i, letter[1])
 
     def reset(self):
-        """ Reset the value of all cells to None """
-        for row in range(20):
-            for col in range(10):
-                self.grid[row][col].value = None
-
-        for row in range(4):
-            for col in range(4):
-                self.grid_aux[row][col].value = None
-                self.grid_aux[row][col].text = ''
-
-        self.lines_counter = 0
-        self.score = 0
-        self.ids.score_label.text = str(self.score)
-        self.level = 1
-        self.ids.level_label.text = 'Level 1'
-        self.first = True
-
-    def play(self):
-        """ Implementation of the game """
-        new_figure = True
-
-        while self.playing:
-            # Figure on the grid
-            if not new_figure:
-                new_figure = not self.move_figure(DOWN)
-            # Spawn a new figure at the top of the grid
-            else:
-                new_figure = False
+        """ Start a new game in the engine (recording it) and draw it """
+        self.engine = Recorder()
+        self.clear()
+        self.render()
+
+    def clear(self):
+        """ Empty both grids and remove the text of the auxiliar one """
+        for board in [self.board, self.board_aux]:
+            for row in range(board.rows):
+                for col in range(board.cols):
+                    board.set(row, col, None)
+        self.board_aux.clear_text()
+
+        self.next_figure = None
+
+    def render(self):
+        """ Draw the cells changed in the engine, the labels and next figure """
+        engine = self.engine
+
+        for row, col, value in engine.changes():
+            self.board.set(row, col, value)
+
+        self.ids.score_label.text = str(engine.score)
+        self.ids.level_label.text = 'Level ' + str(engine.level)
+
+        # Draw the next figure if it has changed
+        if engine.next_figure != self.next_figure:
+            self.next_figure = engine.next_figure
+            figure = FIGURES[self.next_figure]
+            for row in range(4):
+                for col in range(4):
+                    self.board_aux.set(row, col, figure[0] if (row, col) in
+                                       figure[1] else None)
+
+    def speed(self):
+        """ Seconds per move, depending on the level """
+        return AUTOPLAY_SPEED if self.autoplay else SPEEDS[self.engine.level]
+
+    def tick(self):
+        """ One move of the game, called by the loop """
+        if self.autoplay:
+            self.update(play_move(self.engine))
+        else:
+            self.update(self.engine.step())
+        self.loop.step = self.speed()
 
-                self.spawn_random_figure()
+    def on_key(self, key):
+        """ Apply a key buffered by the loop """
+        if key == 273:       # key: UP
+            self.rotate_figure()
 
-            # Initial speed, 1 second per move
-            speed = SPEEDS[self.level]
-            sleep(speed)
+        elif key == 275:     # key: RIGHT
+            self.move_figure(RIGHT)
 
-    def spawn_random_figure(self):
-        """
-        Spawn a random figure at the top of the grid (centered)
-        """
-        self.origin = CENTER
+        elif key == 274:     # key: DOWN
+            self.drop_figure()
 
-        # Check if there is a completed row
-        self.check_lines()
+        elif key == 276:     # key: LEFT
+            self.move_figure(LEFT)
 
-        if not self.first:
-            self.color = self.next_figure[0]
-            self.figure_set = self.next_figure[1:]
-            self.figure = self.figure_set[0]
+        elif key == 97:      # key: A, autoplayer on/off
+            self.autoplay = not self.autoplay
+            self.loop.step = self.speed()
+
+    def update(self, playing):
+        """ Render the engine after an action, playing is its result """
+        if not playing and not self.engine.playing:
+            self.game_over()
         else:
-            selection = choice(range(7))
-            self.color = FIGURES[selection][0]
-            self.figure_set = FIGURES[selection][1:]
-            self.figure = self.figure_set[0]
-            self.first = False
-
-        # Select one random figure
-        selection = choice(range(7))
-        self.next_figure = FIGURES[selection]
-
-        # Remove old next figure
-        for row in range(4):
-            for col in range(4):
-                self.grid_aux[row][col].value = None
-
-        # check if game over
-        for x, y in self.figure_set[0]:
-            if self.grid[self.origin[0]+x][self.origin[1]+y].value is not None:
-                self.game_over()
-                self.playing = False
-                return
-
-        # Draw the next figure
-        for x, y in self.next_figure[1]:
-            self.grid_aux[x][y].value = self.next_figure[0]
-
-        # Draw the figure with the default rotation
-        for x, y in self.figure_set[0]:
-            self.grid[self.origin[0]+x][self.origin[1]+y].value = self.color
-
-    def check_lines(self):
-        """ Check if there are rows to delete (completed rows) """
-        for row in range(-1, -20, -1):
-            # Precondition: the line is complete
-            line = True
-            # Number of completed lines
-            lines = 0
-            # To check if the player has complete 10 more lines (next level)
-            next_level = self.lines_counter % 10
-
-            while line:     # while to handle completed rows in a row
-                for col in range(10):
-                    # If one of the cells is empty, not a completed row
-                    if self.grid[row][col].value is None:
-                        line = False
-
-                if line:
-                    lines += 1
-                    for new_row in range(row, -20, -1):
-                        for new_col in range(10):
-                            # Copy the value of the top cell
-                            self.grid[new_row][new_col].value = \
-                                self.grid[new_row-1][new_col].value
-
-            # Update the score
-            if lines:
-                self.lines_counter += lines
-                next_level += lines
-
-                # If increase level condition reached
-                if next_level >= 10:
-                    self.increase_level()
-
-                # Maximum score for 4 lines
-                if lines > 4:
-                    lines = 4
-
-                self.score += SCORES[lines]
-                self.ids.score_label.text = str(self.score)
-
-    def increase_level(self):
-        self.level += 1
-        self.ids.level_label.text = 'Level ' + str(self.level)
+            self.render()
 
     def move_figure(self, side):
         """
         Makes the actual figure move one row or column to side (param)
                 return -- True if it is possible to make the move
         """
-        new_figure, side_cells = self.get_moved_figure(side)
-        origin_x, origin_y = self.origin[0], self.origin[1]
-
-        # Check if it is possible to make the move
-        for x, y in side_cells:
-            try:
-                down_cell_value = \
-                    self.grid[origin_x+x][origin_y+y].value
-            # If figure at the bottom, not possible to make the move
-            except IndexError:
-                return False
-
-            # If the cell value of the row down cell is not None or the value
-            # of col is lower than 0, it is not possible to make the move
-            if down_cell_value is not None or origin_y + y < 0:
-                return False
-
-        # Remove old position
-        for x, y in self.figure:
-            self.grid[origin_x+x][origin_y+y].value = None
-
-        # Draw the new position
-        for x, y in new_figure:
-            self.grid[origin_x+x][origin_y+y].value = self.color
-
-        # Update the origin of the figure
-        self.origin = (origin_x+side[0], origin_y+side[1])
-
-        return True
+        moved = self.engine.move(side)
+        self.update(moved)
+        return moved
 
     def rotate_figure(self):
         """ change figure to its next rotation state """
-        index = self.figure_set.index(self.figure)
-        origin_x, origin_y = self.origin[0], self.origin[1]
-        is_possible = True
-
-        # figure_set acts as a rotatory data structure
-        if index == 3:
-            new_index = 0
-        else:
-            new_index = index + 1
-
-        # Remove old position
-        for x, y in self.figure:
-            self.grid[origin_x+x][origin_y+y].value = None
-
-        # check if is possible to make the rotation
-        for x, y in self.figure_set[new_index]:
-            try:
-                if self.grid[origin_x+x][origin_y+y].value is not None or \
-                        origin_x+x < 0 or \
-                        origin_y+y < 0:
-                    is_possible = False
-            except IndexError:
-                is_possible = False
-
-        if is_possible:
-            self.figure = self.figure_set[new_index]
-
-        # Draw the new position (or old one if not possible)
-        for x, y in self.figure:
-            self.grid[origin_x+x][origin_y+y].value = self.color
-
-    def get_moved_figure(self, side):
-        """
-        Return the coordinates of the figure moved to side (param) and
-            the side cells of the figure
-        """
-        new_figure = [(x + side[0], y + side[1]) for x, y in self.figure]
-        side_cells = [(x, y) for x, y in new_figure if (x, y)
-                      not in self.figure]
+        self.update(self.engine.rotate())
 
-        return new_figure, side_cells
+    def drop_figure(self):
+        """ move the figure to the bottom and spawn the next one """
+        self.update(self.engine.drop())
 
 
 class MainApp(App):
@@ -451,26 +399,9 @@ class MainApp(App):
         return sm
 
     def on_key_down(self, window, key, *args):
-        self.game_screen.lock = False
-
+        # Applied by the game loop in the next frame
         if self.game_screen.playing:
-            if key == 273:       # key: UP
-                self.game_screen.rotate_figure()
-
-            elif key == 275:     # key: RIGHT
-                self.game_screen.move_figure(RIGHT)
-
-            elif key == 274:     # key: DOWN
-                bottom = False
-
-                # Move down until not possible to keep moving down
-                while not bottom:
-                    bottom = not self.game_screen.move_figure(DOWN)
-
-                self.game_screen.spawn_random_figure()
-
-            elif key == 276:     # key: LEFT
-                self.game_screen.move_figure(LEFT)
+            self.game_screen.loop.push(key)
 
 
 if __name__ == '__main__':